@@ -4,12 +4,14 @@ Handles file uploads, translation, and downloads for both IDML and Word formats
 """
 
 import os
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, send_file, render_template, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from pathlib import Path
 from dotenv import load_dotenv
-from translator_core import IDMLTranslator
+from job_queue import JobManager, upload_name, display_name
+from translator_core import ensure_word_document
+from metrics import REGISTRY
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +28,10 @@ CORS(app)
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Background translation workers (one job per worker at a time)
+# Jobs expire after an hour; their outputs go with them so uploads/ stays bounded
+job_manager = JobManager(max_workers=int(os.getenv('TRANSLATION_WORKERS', 2)), remove_outputs=True)
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'idml'}
 
@@ -41,7 +47,7 @@ def index():
 
 @app.route('/api/translate', methods=['POST'])
 def translate():
-    """Handle IDML file upload and translation"""
+    """Handle IDML file upload and queue it for translation"""
     try:
         # Check if file is present
         if 'file' not in request.files:
@@ -55,51 +61,54 @@ def translate():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Only .idml files are allowed'}), 400
         
-        # Get API key from form or environment (optional now - using free translation)
-        api_key = request.form.get('api_key') or os.getenv('GOOGLE_API_KEY')
         # API key is optional now since we're using free Google Translate
         
         # Get target language (default to Arabic)
         target_lang = request.form.get('target_lang', 'ar')
         
-        # Save uploaded file
+        # Save uploaded file under a unique name so concurrent uploads don't collide
         filename = secure_filename(file.filename)
-        upload_path = Path(app.config['UPLOAD_FOLDER']) / filename
+        upload_path = Path(app.config['UPLOAD_FOLDER']) / upload_name(filename)
         file.save(upload_path)
         
-        # Initialize translator with target language
-        translator = IDMLTranslator(api_key, target_lang=target_lang)
-        
-        # Track progress (simple implementation)
-        progress_data = {'status': 'Starting...', 'progress': 0}
-        
-        def progress_callback(status, progress):
-            progress_data['status'] = status
-            progress_data['progress'] = progress
-            print(f"Progress: {progress}% - {status}")
-        
-        # Perform translation
-        output_paths = translator.translate_idml(str(upload_path), progress_callback)
+        # Queue the translation; the worker removes the upload when done
+        job = job_manager.submit(upload_path, filename, target_lang)
         
-        # Clean up uploaded file
-        os.remove(upload_path)
-        
-        # Return JSON with both file names
         return jsonify({
             'success': True,
-            'idml_file': Path(output_paths['idml']).name,
-            'word_file': Path(output_paths['word']).name
-        })
+            'job_id': job.id,
+            'status_url': f"/api/jobs/{job.id}"
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report status, per-stage progress and result file names of a translation job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List known translation jobs, newest first"""
+    return jsonify({'jobs': [job.to_dict() for job in job_manager.list()]})
+
+
 @app.route('/api/download/<file_type>/<filename>', methods=['GET'])
 def download_file(file_type, filename):
     """Download translated file (IDML or Word)"""
     try:
-        file_path = Path(app.config['UPLOAD_FOLDER']) / filename
+        file_path = Path(app.config['UPLOAD_FOLDER']) / secure_filename(filename)
+        
+        # Word documents are built from the translated IDML on first download
+        idml_path = file_path.with_suffix('.idml')
+        if file_type == 'word' and idml_path.exists():
+            ensure_word_document(idml_path, file_path)
         
         if not file_path.exists():
             return jsonify({'error': 'File not found'}), 404
@@ -110,24 +119,15 @@ def download_file(file_type, filename):
         else:  # idml
             mimetype = 'application/octet-stream'
         
-        response = send_file(
+        # Outputs are kept until the job expires (see JOB_RETENTION_SECONDS), so a
+        # retried download is served again; identical uploads hit the result cache
+        return send_file(
             str(file_path),
             as_attachment=True,
-            download_name=filename,
+            download_name=display_name(file_path),
             mimetype=mimetype
         )
         
-        # Clean up file after download
-        @response.call_on_close
-        def cleanup():
-            try:
-                if file_path.exists():
-                    os.remove(file_path)
-            except:
-                pass
-        
-        return response
-        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -138,6 +138,12 @@ def health():
     return jsonify({'status': 'healthy', 'service': 'IDML Arabic Translator'})
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline metrics in the Prometheus text exposition format"""
+    return Response(REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("IDML Arabic Translation Tool - Web Server")
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Batch IDML Translation - Command Line Tool
+Translates a folder (or glob) of IDML files in parallel across CPU cores
+
+Usage:
+    python batch_translate.py drops/2026-10/ --target ar --output-dir translated/
+    python batch_translate.py "drops/**/*.idml" --target en --workers 4
+    python batch_translate.py drops/rev2/ --previous-dir translated/rev1/ -o translated/rev2/
+
+All worker processes share the on-disk translation memory, so segments
+repeated across documents are only translated once.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from translator_core import IDMLTranslator, DEFAULT_CONCURRENCY, ensure_word_document
+from translation_backends import BACKENDS
+from segment_manifest import load_manifest
+
+
+def find_idml_files(inputs):
+    """Expand directories and glob patterns into a sorted list of IDML files"""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, '*.idml'))
+        else:
+            matches = glob.glob(item, recursive=True)
+        found.update(os.path.abspath(m) for m in matches if m.lower().endswith('.idml'))
+    return sorted(found)
+
+
+def find_output_collisions(files, output_dir, target_lang):
+    """
+    Group input files that would write the same outputs, i.e. files with the
+    same name in different folders
+
+    Returns:
+        Dict of output IDML path -> input files, only for paths shared by several inputs
+    """
+    translator = IDMLTranslator(target_lang=target_lang, output_dir=output_dir, result_cache=False)
+    by_output = {}
+    for idml_path in files:
+        output = os.path.normcase(str(translator.output_paths_for(idml_path)['idml']))
+        by_output.setdefault(output, []).append(idml_path)
+    return {output: paths for output, paths in by_output.items() if len(paths) > 1}
+
+
+def is_up_to_date(idml_path, output_dir, target_lang, word=True, backend=None):
+    """
+    True if the outputs exist, are newer than the source file and were made
+    with the same settings. Outputs for every target language share one
+    name, so the manifest's target language is checked, and its job key
+    when the job went through the result cache.
+    """
+    translator = IDMLTranslator(target_lang=target_lang, output_dir=output_dir,
+                                backend=backend, result_cache=False)
+    outputs = translator.output_paths_for(idml_path)
+    if not word:
+        del outputs['word']
+    source_mtime = os.path.getmtime(idml_path)
+    if not all(
+        os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+        for path in outputs.values()
+    ):
+        return False
+
+    manifest = load_manifest(str(outputs['idml']))
+    if manifest is None or manifest.get('target_lang') != target_lang:
+        return False
+    cache_key = manifest.get('cache_key')
+    return cache_key is None or cache_key == translator.job_key(idml_path)
+
+
+def previous_output_for(idml_path, previous_dir, target_lang):
+    """Earlier translation of a file in previous_dir, preferring its reviewed (_edited) version"""
+    if not previous_dir:
+        return None
+    translated = IDMLTranslator(target_lang=target_lang, output_dir=previous_dir,
+                                result_cache=False).output_paths_for(idml_path)['idml']
+    for candidate in (translated.with_name(f"{translated.stem}_edited.idml"), translated):
+        if candidate.exists():
+            return str(candidate)
+    return None
+
+
+def translate_one(idml_path, target_lang, output_dir, concurrency, backend, word=True,
+                  previous_dir=None):
+    """Translate a single file (and build its Word document) in a worker process"""
+    started = time.time()
+    summary = {'file': idml_path, 'status': 'translated'}
+    try:
+        translator = IDMLTranslator(target_lang=target_lang, concurrency=concurrency,
+                                    output_dir=output_dir, backend=backend)
+        previous = previous_output_for(idml_path, previous_dir, target_lang)
+        result = translator.translate_idml(idml_path, previous_output=previous)
+        summary['idml'] = result['idml']
+        if word:
+            summary['word'] = ensure_word_document(result['idml'], result['word'],
+                                                   segments=result['translations'],
+                                                   cache_key=result['cache_key'])
+        summary['segments'] = len(result['translations'])
+        summary['characters'] = sum(len(t['original']) for t in result['translations'])
+        summary['skipped_segments'] = result['metrics']['counters']['skipped_segments']
+        if result['metrics']['counters'].get('result_cache_hits'):
+            summary['status'] = 'cached'
+        if previous:
+            summary['previous'] = previous
+            summary['reused_segments'] = result['metrics']['counters'].get('reused_segments', 0)
+    except Exception as e:
+        summary['status'] = 'failed'
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.time() - started, 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Translate a batch of IDML files')
+    parser.add_argument('inputs', nargs='+', help='IDML files, directories or glob patterns')
+    parser.add_argument('--target', '-t', default='ar', choices=['ar', 'en'],
+                        help='Target language (default: ar)')
+    parser.add_argument('--output-dir', '-o', default='translated',
+                        help='Folder for translated IDML and Word files (default: translated)')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count() or 1,
+                        help='Number of documents translated in parallel (default: CPU count)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Translation requests in flight per document')
+    parser.add_argument('--backend', default=None, choices=sorted(BACKENDS),
+                        help='Translation backend (default: TRANSLATION_BACKEND or google)')
+    parser.add_argument('--no-word', action='store_true',
+                        help='Only write the translated IDML files, no Word documents')
+    parser.add_argument('--previous-dir', default=None,
+                        help='Folder with translations of an earlier revision; unchanged stories '
+                             'and segments (reviewer edits included) are reused from it')
+    parser.add_argument('--force', action='store_true',
+                        help='Retranslate files whose outputs are already up to date')
+    parser.add_argument('--report', default=None,
+                        help='Summary report path (default: <output-dir>/batch_report.json)')
+    args = parser.parse_args(argv)
+
+    files = find_idml_files(args.inputs)
+    if not files:
+        print("No IDML files found.")
+        return 1
+
+    # Every output lands directly in --output-dir, so same-named files would overwrite each other
+    collisions = find_output_collisions(files, args.output_dir, args.target)
+    if collisions:
+        print("Input files with the same name would overwrite each other's outputs:")
+        for output, paths in sorted(collisions.items()):
+            print(f"  {os.path.basename(output)}: {', '.join(paths)}")
+        print("Rename them or translate each folder into its own --output-dir.")
+        return 1
+
+    summaries = []
+    pending = []
+    for idml_path in files:
+        if not args.force and is_up_to_date(idml_path, args.output_dir, args.target, not args.no_word,
+                                             args.backend):
+            summaries.append({'file': idml_path, 'status': 'skipped'})
+        else:
+            pending.append(idml_path)
+
+    print(f"Found {len(files)} IDML files: {len(pending)} to translate, "
+          f"{len(files) - len(pending)} already up to date")
+
+    started = time.time()
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(pending)))) as pool:
+            futures = [
+                pool.submit(translate_one, path, args.target, args.output_dir, args.concurrency,
+                            args.backend, not args.no_word, args.previous_dir)
+                for path in pending
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                summary = future.result()
+                summaries.append(summary)
+                detail = summary.get('error') or f"{summary.get('segments', 0)} segments"
+                print(f"[{done}/{len(pending)}] {summary['status']}: "
+                      f"{os.path.basename(summary['file'])} ({detail}, {summary['seconds']}s)")
+
+    summaries.sort(key=lambda s: s['file'])
+    report = {
+        'target_lang': args.target,
+        'output_dir': os.path.abspath(args.output_dir),
+        'total_seconds': round(time.time() - started, 2),
+        'translated': sum(1 for s in summaries if s['status'] == 'translated'),
+        'cached': sum(1 for s in summaries if s['status'] == 'cached'),
+        'skipped': sum(1 for s in summaries if s['status'] == 'skipped'),
+        'failed': sum(1 for s in summaries if s['status'] == 'failed'),
+        'skipped_segments': sum(s.get('skipped_segments', 0) for s in summaries),
+        'files': summaries,
+    }
+
+    report_path = args.report or os.path.join(args.output_dir, 'batch_report.json')
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\nTranslated: {report['translated']}  Cached: {report['cached']}  Skipped: {report['skipped']}  "
+          f"Failed: {report['failed']}  ({report['total_seconds']}s)")
+    print(f"Report written to {report_path}")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+Offline Benchmark Suite
+Synthetic IDML generation and a stage-timing runner that uses the
+in-process translation_backends.LocalBackend
+
+Run with:
+    python -m benchmark.run_benchmark --stories 200 --segments 50 --latency 0.05
+"""
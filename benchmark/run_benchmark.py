@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark Runner
+Times each translate_idml stage on a synthetic document with the local
+stand-in backend and saves the results as JSON
+
+Usage:
+    python -m benchmark.run_benchmark --stories 100 --segments 40 --latency 0.05
+    python -m benchmark.run_benchmark --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import tracemalloc
+
+import translator_core
+from translator_core import IDMLTranslator, ensure_word_document
+from benchmark.synthetic_idml import generate_idml
+from translation_backends import LocalBackend, ResilientBackend
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def run_once(idml_path, output_dir, args):
+    """Translate the document once and return the measurements"""
+    service = LocalBackend(latency=args.latency, per_char_latency=args.per_char_latency,
+                           max_requests_per_second=args.max_rps, error_rate=args.error_rate, seed=0,
+                           reject_over_limit=args.reject_over_limit)
+    # Same retry, circuit breaker and adaptive rate handling as production
+    backend = ResilientBackend(service)
+    translator = IDMLTranslator(target_lang=args.target, concurrency=args.concurrency,
+                                output_dir=output_dir, backend=backend, result_cache=False)
+
+    # tracemalloc slows allocation-heavy stages down, so it is opt-in
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = translator.translate_idml(idml_path)
+    # Word output is built on demand; time it as if downloaded straight away
+    word_started = time.perf_counter()
+    ensure_word_document(result['idml'], result['word'], segments=result['translations'])
+    word_seconds = time.perf_counter() - word_started
+    total = time.perf_counter() - started
+    peak = None
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'total_seconds': round(total, 4),
+        # Stage timings come from the pipeline's built-in instrumentation
+        'stages': dict({
+            stage: {'wall': t['wall_seconds'], 'cpu': t['cpu_seconds']}
+            for stage, t in result['metrics']['stages'].items()
+        }, word={'wall': round(word_seconds, 4), 'cpu': None}),
+        'counters': result['metrics']['counters'],
+        'segments': len(result['translations']),
+        'backend_requests': service.requests,
+        'backend_characters': service.characters,
+        'backend_resilience': backend.stats(),
+        'python_peak_bytes': peak,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        'output_bytes': os.path.getsize(result['idml']),
+    }
+
+
+def summarize(runs):
+    """Best (minimum) wall time per stage across repeated runs"""
+    stages = {}
+    for run in runs:
+        for stage, t in run['stages'].items():
+            stages[stage] = min(stages.get(stage, float('inf')), t['wall'])
+    return {
+        'best_total_seconds': min(run['total_seconds'] for run in runs),
+        'best_stage_seconds': stages,
+    }
+
+
+def print_comparison(current, baseline):
+    """Print per-stage deltas against a previous results file"""
+    print(f"\nComparison with {baseline.get('label') or 'baseline'}:")
+    old, new = baseline['summary'], current['summary']
+    rows = [('total', old['best_total_seconds'], new['best_total_seconds'])]
+    for stage in new['best_stage_seconds']:
+        rows.append((stage, old['best_stage_seconds'].get(stage), new['best_stage_seconds'][stage]))
+    for stage, before, after in rows:
+        if before:
+            print(f"  {stage:<12} {before:>9.3f}s -> {after:>9.3f}s  ({after / before:.2f}x)")
+        else:
+            print(f"  {stage:<12} {'-':>10} -> {after:>9.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the IDML translation pipeline offline')
+    parser.add_argument('--stories', type=int, default=50)
+    parser.add_argument('--segments', type=int, default=40, help='Segments per story')
+    parser.add_argument('--text-length', type=int, default=60, help='Characters per segment')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3)
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--image-size', type=int, default=512 * 1024, help='Bytes per image')
+    parser.add_argument('--latency', type=float, default=0.02, help='Backend seconds per request')
+    parser.add_argument('--per-char-latency', type=float, default=0.0)
+    parser.add_argument('--max-rps', type=float, default=None, help='Backend request rate limit')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of failing requests')
+    parser.add_argument('--reject-over-limit', action='store_true',
+                        help='Answer requests over --max-rps with 429s instead of queueing them')
+    parser.add_argument('--concurrency', type=int, default=translator_core.DEFAULT_CONCURRENCY)
+    parser.add_argument('--target', default='ar', choices=['ar', 'en'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Record peak Python heap usage with tracemalloc (slows the run)')
+    parser.add_argument('--with-cache', action='store_true',
+                        help='Keep the translation memory enabled (disabled by default)')
+    parser.add_argument('--label', default=None, help='Name stored with the results')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help='Previous results file to compare against')
+    args = parser.parse_args(argv)
+
+    if not args.with_cache:
+        os.environ['TRANSLATION_MEMORY_DISABLED'] = '1'
+
+    work_dir = tempfile.mkdtemp(prefix='idml_bench_')
+    try:
+        idml_path = generate_idml(
+            os.path.join(work_dir, 'synthetic.idml'), stories=args.stories,
+            segments_per_story=args.segments, text_length=args.text_length,
+            duplicate_ratio=args.duplicate_ratio, images=args.images, image_size=args.image_size,
+        )
+        print(f"Generated {idml_path} ({os.path.getsize(idml_path) / 1024:.0f} KB)")
+
+        runs = []
+        for i in range(args.repeat):
+            run = run_once(idml_path, os.path.join(work_dir, f'run_{i}'), args)
+            runs.append(run)
+            stages = '  '.join(f"{s}={t['wall']:.3f}s" for s, t in run['stages'].items())
+            print(f"Run {i + 1}/{args.repeat}: {run['total_seconds']:.3f}s  {stages}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'label': args.label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': vars(args),
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
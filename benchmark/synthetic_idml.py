@@ -0,0 +1,122 @@
+"""
+Synthetic IDML Generator
+Builds IDML archives with a configurable number of stories, segments,
+text length, duplicate ratio and embedded image sizes
+"""
+
+import os
+import random
+import zipfile
+
+PACKAGING_NS = 'http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging'
+
+WORDS = (
+    'catalogue product quality design premium delivery service customer price '
+    'offer collection season material colour size warranty order support new '
+    'classic modern comfort durable natural brand store online available'
+).split()
+
+FONTS = ['Minion Pro\tRegular', 'Myriad Pro\tBold', 'Helvetica\tItalic', 'Futura', 'Comic Sans MS']
+
+STYLES_XML = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<idPkg:Styles xmlns:idPkg="{PACKAGING_NS}" DOMVersion="16.0">
+<RootCharacterStyleGroup Self="u79">
+<CharacterStyle Self="CharacterStyle/$ID/[No character style]" Name="$ID/[No character style]"/>
+<CharacterStyle Self="CharacterStyle/Emphasis" Name="Emphasis" AppliedFont="Myriad Pro"/>
+</RootCharacterStyleGroup>
+<RootParagraphStyleGroup Self="u78">
+<ParagraphStyle Self="ParagraphStyle/$ID/NormalParagraphStyle" Name="$ID/NormalParagraphStyle" Justification="LeftAlign"/>
+<ParagraphStyle Self="ParagraphStyle/Heading" Name="Heading" Justification="CenterAlign"/>
+</RootParagraphStyleGroup>
+</idPkg:Styles>
+'''
+
+FONTS_XML = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<idPkg:Fonts xmlns:idPkg="{PACKAGING_NS}" DOMVersion="16.0">
+<FontFamily Self="di1" Name="Minion Pro"/>
+<FontFamily Self="di2" Name="Myriad Pro"/>
+</idPkg:Fonts>
+'''
+
+
+def _sentence(rng, length):
+    """Random English-looking text of roughly length characters"""
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words).capitalize()
+
+
+def _story_xml(story_id, segments):
+    """Build one story with a paragraph per segment and alternating fonts"""
+    ranges = []
+    for i, text in enumerate(segments):
+        # Font style is tab-separated in IDML; escape it so the tab survives parsing
+        font = FONTS[i % len(FONTS)].replace('\t', '&#9;')
+        ranges.append(
+            f'<ParagraphStyleRange AppliedParagraphStyle="ParagraphStyle/$ID/NormalParagraphStyle">'
+            f'<CharacterStyleRange AppliedCharacterStyle="CharacterStyle/$ID/[No character style]" '
+            f'AppliedFont="{font}"><Content>{text}</Content><Br/></CharacterStyleRange>'
+            f'</ParagraphStyleRange>'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<idPkg:Story xmlns:idPkg="{PACKAGING_NS}" DOMVersion="16.0">\n'
+        f'<Story Self="{story_id}" AppliedTOCStyle="n" TrackChanges="false">\n'
+        '<StoryPreference OpticalMarginAlignment="false" FrameType="TextFrameType"/>\n'
+        + '\n'.join(ranges) +
+        '\n</Story>\n</idPkg:Story>\n'
+    )
+
+
+def generate_idml(path, stories=20, segments_per_story=30, text_length=60,
+                  duplicate_ratio=0.3, images=2, image_size=256 * 1024, seed=42):
+    """
+    Write a synthetic IDML archive
+
+    Args:
+        path: Output file path
+        stories: Number of Stories/*.xml members
+        segments_per_story: Content segments per story
+        text_length: Approximate characters per segment
+        duplicate_ratio: Fraction of segments drawn from a small shared pool
+            (headers, captions, footers repeated across the document)
+        images: Number of embedded binary members under Links/
+        image_size: Size in bytes of each embedded image (incompressible)
+        seed: Random seed, so the same arguments produce the same document
+
+    Returns:
+        Path to the generated file
+    """
+    rng = random.Random(seed)
+    shared_pool = [_sentence(rng, text_length) for _ in range(max(1, segments_per_story // 5))]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # InDesign requires an uncompressed mimetype entry first
+        archive.writestr(zipfile.ZipInfo('mimetype'), 'application/vnd.adobe.indesign-idml-package',
+                         compress_type=zipfile.ZIP_STORED)
+
+        story_ids = [f'u{1000 + i:x}' for i in range(stories)]
+        story_refs = ''.join(f'<idPkg:Story src="Stories/Story_{sid}.xml"/>' for sid in story_ids)
+        archive.writestr('designmap.xml',
+                         f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         f'<Document xmlns:idPkg="{PACKAGING_NS}" DOMVersion="16.0">{story_refs}</Document>\n')
+        archive.writestr('Resources/Styles.xml', STYLES_XML)
+        archive.writestr('Resources/Fonts.xml', FONTS_XML)
+        archive.writestr('Spreads/Spread_u1.xml',
+                         f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         f'<idPkg:Spread xmlns:idPkg="{PACKAGING_NS}" DOMVersion="16.0"/>\n')
+
+        for i in range(images):
+            image = rng.getrandbits(image_size * 8).to_bytes(image_size, 'little')
+            archive.writestr(f'Links/image_{i}.jpg', image)
+
+        for sid in story_ids:
+            segments = [
+                rng.choice(shared_pool) if rng.random() < duplicate_ratio else _sentence(rng, text_length)
+                for _ in range(segments_per_story)
+            ]
+            archive.writestr(f'Stories/Story_{sid}.xml', _story_xml(sid, segments))
+
+    return path
@@ -0,0 +1,99 @@
+"""
+Font Mapper
+Table-driven mapping of document fonts to fonts that can render the target
+language, with each distinct font value resolved once per job
+
+A per-language table can be supplied as FONT_MAP_DIR/<lang>.json:
+
+    {"map": {"Minion Pro": "Adobe Arabic"}, "default": "Arial", "keep": ["Adobe Arabic", "Arial"]}
+
+Keys that are left out fall back to the built-in table.
+"""
+
+import os
+import json
+from functools import lru_cache
+
+FONT_MAP_DIR = os.getenv('FONT_MAP_DIR', 'font_maps')
+
+# Comprehensive font mapping dictionary - map common fonts to Arabic-compatible ones
+FONT_MAP = {
+    'Minion Pro': 'Adobe Arabic',
+    'Myriad Pro': 'Adobe Arabic',
+    'Times New Roman': 'Arial',
+    'Times': 'Arial',
+    'Helvetica': 'Arial',
+    'Helvetica Neue': 'Arial',
+    'Calibri': 'Arial',
+    'Verdana': 'Arial',
+    'Georgia': 'Arial',
+    'Garamond': 'Adobe Arabic',
+    'Palatino': 'Adobe Arabic',
+    'Baskerville': 'Adobe Arabic',
+    'Futura': 'Arial',
+    'Avenir': 'Arial',
+}
+
+# Fonts without a mapping fall back to DEFAULT_FONT unless they contain one of KEEP_FONTS
+DEFAULT_FONT = 'Arial'
+KEEP_FONTS = ('Adobe Arabic', 'Arial')
+
+
+@lru_cache(maxsize=None)
+def load_font_table(target_lang):
+    """
+    Font table for a target language
+
+    Returns:
+        (ordered list of (old, new) pairs, default font, fonts kept as they are)
+    """
+    config = {}
+    config_path = os.path.join(FONT_MAP_DIR, f'{target_lang}.json')
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        print(f"Loaded font map for '{target_lang}' from {config_path}")
+
+    return (
+        tuple(config.get('map', FONT_MAP).items()),
+        config.get('default', DEFAULT_FONT),
+        tuple(config.get('keep', KEEP_FONTS)),
+    )
+
+
+class FontMapper:
+    def __init__(self, target_lang='ar'):
+        """Maps font values for one job; results are memoized per distinct value"""
+        self.mappings, self.default_font, self.keep_fonts = load_font_table(target_lang)
+        self._cache = {}
+
+    def map(self, current_font):
+        """Map a font value such as 'Minion Pro' or 'Minion Pro\tBold'"""
+        mapped = self._cache.get(current_font)
+        if mapped is None:
+            mapped = self._cache[current_font] = self._resolve(current_font)
+        return mapped
+
+    def map_family(self, family):
+        """Map a font family name through the table only, without the default fallback"""
+        for old_font, new_font in self.mappings:
+            if old_font in family:
+                return family.replace(old_font, new_font)
+        return family
+
+    def _resolve(self, current_font):
+        # The first table entry contained in the value wins
+        for old_font, new_font in self.mappings:
+            if old_font in current_font:
+                return current_font.replace(old_font, new_font)
+
+        # If no specific mapping found, fall back to the default font so
+        # ALL text uses a font that can render the target language
+        if not any(font in current_font for font in self.keep_fonts):
+            # Keep the font style (Regular, Bold, Italic, etc.) if present
+            if '\t' in current_font:
+                parts = current_font.split('\t')
+                return f"{self.default_font}\t{parts[1] if len(parts) > 1 else 'Regular'}"
+            return self.default_font
+
+        return current_font
@@ -0,0 +1,149 @@
+"""
+IDML Archive Helpers
+Read IDML members straight from the ZIP archive and write output archives
+that copy untouched members without decompressing and recompressing them
+"""
+
+import copy
+import shutil
+import hashlib
+import struct
+import zipfile
+from lxml import etree
+
+
+def open_idml(idml_path):
+    """
+    Open and validate an IDML archive
+
+    Returns:
+        Open zipfile.ZipFile (the caller is responsible for closing it)
+    """
+    try:
+        archive = zipfile.ZipFile(idml_path, 'r')
+    except FileNotFoundError:
+        raise Exception(f"IDML file not found: {idml_path}")
+    except IsADirectoryError:
+        raise Exception(f"Path is not a file: {idml_path}")
+    except zipfile.BadZipFile:
+        raise Exception("Invalid IDML file: Not a valid ZIP archive")
+    except Exception as e:
+        raise Exception(f"Cannot read IDML file: {str(e)}")
+
+    # Validate structure
+    names = archive.namelist()
+    if not any(name.startswith('Stories/') for name in names):
+        archive.close()
+        raise Exception("Invalid IDML: Stories folder not found")
+    if not any(name.startswith('Resources/') for name in names):
+        archive.close()
+        raise Exception("Invalid IDML: Resources folder not found")
+
+    return archive
+
+
+def story_members(archive):
+    """Return the names of all story XML members, in archive order"""
+    return [
+        name for name in archive.namelist()
+        if name.startswith('Stories/') and name.endswith('.xml')
+    ]
+
+
+def read_xml_member(archive, member_name):
+    """Parse an archive member into an lxml tree"""
+    parser = etree.XMLParser(remove_blank_text=False)
+    return etree.fromstring(archive.read(member_name), parser).getroottree()
+
+
+def member_fingerprint(archive, member_name, chunk_size=1024 * 1024):
+    """Content hash of a member's uncompressed bytes, used to spot changed stories"""
+    digest = hashlib.sha1()
+    with archive.open(member_name) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def xml_bytes(tree):
+    """Serialize a tree the same way IDML members are written"""
+    return etree.tostring(tree, encoding='UTF-8', xml_declaration=True, pretty_print=False)
+
+
+def read_story_trees(idml_path):
+    """
+    Parse every story of an IDML file
+
+    Returns:
+        Dict of story file name (e.g. 'Story_u1d8.xml') -> lxml tree
+    """
+    with open_idml(idml_path) as archive:
+        return {
+            name.split('/', 1)[1]: read_xml_member(archive, name)
+            for name in story_members(archive)
+        }
+
+
+def copy_member_raw(source, target, info):
+    """
+    Copy one member's compressed bytes from source into target
+
+    zipfile has no public API for this, so the local file header is written
+    by hand and the member is registered in the target's central directory.
+    """
+    source.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source.fp.read(zipfile.sizeFileHeader))
+    source.fp.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+    data = source.fp.read(info.compress_size)
+
+    new_info = copy.copy(info)
+    # Sizes and CRC go in the local header, so no data descriptor follows
+    new_info.flag_bits &= ~0x08
+    new_info.extra = zipfile._strip_extra(info.extra, (1,))
+    new_info.header_offset = target.fp.tell()
+
+    target.fp.write(new_info.FileHeader())
+    target.fp.write(data)
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+def write_idml(source, output_path, replacements):
+    """
+    Write a new IDML archive from source with some members replaced
+
+    Member order and compression settings are preserved, which keeps the
+    uncompressed 'mimetype' entry first as InDesign requires.
+
+    Args:
+        source: Open zipfile.ZipFile of the original archive
+        output_path: Path of the archive to create
+        replacements: Dict of member name -> new bytes, a binary file
+            object that is copied into the archive in chunks, or an
+            (open ZipFile, member name) pair whose compressed member is
+            copied as it is
+    """
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            if info.filename in replacements:
+                new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                new_info.compress_type = info.compress_type
+                new_info.external_attr = info.external_attr
+                data = replacements[info.filename]
+                if isinstance(data, tuple):
+                    other, member_name = data
+                    copy_member_raw(other, target, other.getinfo(member_name))
+                elif isinstance(data, bytes):
+                    target.writestr(new_info, data)
+                else:
+                    # A known size lets zipfile pick Zip64 headers for huge members
+                    new_info.file_size = data.seek(0, 2)
+                    data.seek(0)
+                    with target.open(new_info, 'w') as dest:
+                        shutil.copyfileobj(data, dest)
+            else:
+                copy_member_raw(source, target, info)
+
+    return output_path
@@ -0,0 +1,183 @@
+"""
+Translation Job Queue
+Runs IDMLTranslator.translate_idml on a local worker pool so web requests
+return immediately and clients poll for progress
+"""
+
+import os
+import re
+import glob
+import time
+import uuid
+import threading
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from translator_core import IDMLTranslator, word_path_for
+from segment_manifest import manifest_path_for
+
+# Finished jobs are forgotten, and their output files deleted, after this many seconds
+JOB_RETENTION_SECONDS = 3600
+
+# Random prefix of saved uploads, which their output files inherit
+_UPLOAD_PREFIX = re.compile(r'^upload_[0-9a-f]{16}_')
+
+
+def upload_name(filename):
+    """Unique name for saving an upload, so concurrent uploads of one file don't collide"""
+    return f"upload_{os.urandom(8).hex()}_{filename}"
+
+
+def display_name(path):
+    """File name offered to users: the file's name without the upload prefix"""
+    return _UPLOAD_PREFIX.sub('', Path(path).name)
+
+
+def _stage_name(message):
+    """Strip running counts so 'Translating segment 10/200...' groups as one stage"""
+    return re.sub(r'\s*\d+/\d+', '', message).strip()
+
+
+class TranslationJob:
+    def __init__(self, upload_path, filename, target_lang):
+        """A single queued translation"""
+        self.id = uuid.uuid4().hex
+        self.upload_path = upload_path
+        self.filename = filename
+        self.target_lang = target_lang
+        self.status = 'queued'  # queued -> running -> completed | failed
+        self.message = 'Waiting for a free worker...'
+        self.progress = 0
+        self.stages = []  # [{'stage', 'progress', 'started', 'finished'}]
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def update(self, message, progress):
+        """Progress callback passed to translate_idml"""
+        now = time.time()
+        stage = _stage_name(message)
+        if not self.stages or self.stages[-1]['stage'] != stage:
+            if self.stages:
+                self.stages[-1]['finished'] = now
+            self.stages.append({'stage': stage, 'progress': progress, 'started': now, 'finished': None})
+        else:
+            self.stages[-1]['progress'] = progress
+        self.message = message
+        self.progress = progress
+
+    def to_dict(self):
+        """JSON-serializable job status"""
+        data = {
+            'job_id': self.id,
+            'filename': self.filename,
+            'target_lang': self.target_lang,
+            'status': self.status,
+            'message': self.message,
+            'progress': self.progress,
+            'stages': list(self.stages),
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+        if self.result:
+            data['idml_file'] = Path(self.result['idml']).name
+            data['word_file'] = Path(self.result['word']).name
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    def __init__(self, max_workers=2, remove_outputs=False):
+        """
+        Create a worker pool that runs at most max_workers translations at once
+
+        Args:
+            max_workers: Translations run in parallel
+            remove_outputs: Delete a job's output files when it expires. Only
+                for callers that are done with the files by then; Streamlit
+                sessions keep reviewing and editing them for longer.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translate')
+        self.remove_outputs = remove_outputs
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, upload_path, filename, target_lang='ar'):
+        """
+        Queue an uploaded IDML file for translation
+
+        The upload is deleted once the job finishes.
+
+        Returns:
+            The new TranslationJob
+        """
+        job = TranslationJob(str(upload_path), filename, target_lang)
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """Return a job by ID, or None if unknown or expired"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """Return all known jobs, newest first"""
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            translator = IDMLTranslator(target_lang=job.target_lang)
+            job.result = translator.translate_idml(job.upload_path, job.update)
+            job.status = 'completed'
+        except Exception as e:
+            print(f"Job {job.id} failed:\n{traceback.format_exc()}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+            if job.stages:
+                job.stages[-1]['finished'] = job.finished
+            try:
+                os.remove(job.upload_path)
+            except OSError:
+                pass
+
+    def _prune(self):
+        """
+        Forget finished jobs older than JOB_RETENTION_SECONDS and, with
+        remove_outputs, delete their outputs (lock must be held). Repeat
+        uploads of the same file are still answered from the size-limited
+        result cache.
+        """
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished is not None and job.finished < cutoff]
+        for job_id in expired:
+            job = self.jobs.pop(job_id)
+            if self.remove_outputs:
+                _remove_outputs(job)
+
+
+def _remove_outputs(job):
+    """Delete a job's translated IDML, manifest and Word document, and every edited copy"""
+    if not job.result:
+        return
+    idml_path = job.result['idml']
+    outputs = [idml_path, manifest_path_for(idml_path), word_path_for(idml_path)]
+    # Each "Apply" adds another _edited level, with its own manifest and Word document
+    outputs += glob.glob(glob.escape(str(Path(idml_path).with_suffix(''))) + '_edited*')
+    for output in outputs:
+        try:
+            os.remove(output)
+        except OSError:
+            pass
@@ -0,0 +1,161 @@
+"""
+Pipeline Instrumentation
+Per-job stage timings, segment/character counts, backend request latency,
+cache hit rates and I/O byte counts, plus a process-wide registry rendered
+in the Prometheus text exposition format
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the backend request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Cumulative-bucket histogram in the Prometheus style"""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.count += other.count
+        self.sum += other.sum
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 4),
+            'buckets': {str(bound): value for bound, value in zip(self.buckets, self.counts)},
+        }
+
+
+class JobMetrics:
+    def __init__(self):
+        """Measurements for a single translate_idml run"""
+        self.stages = {}  # name -> {'wall': seconds, 'cpu': seconds}
+        self.counters = {
+            'segments': 0,
+            'unique_segments': 0,
+            'characters': 0,
+            'unique_characters': 0,
+            'backend_requests': 0,
+            'backend_errors': 0,
+            'untranslated_segments': 0,
+            'skipped_segments': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'bytes_read': 0,
+            'bytes_written': 0,
+        }
+        self.settings = {}  # target language, backend, ... reported with the measurements
+        self.request_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage (wall clock and process CPU time)"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += time.process_time() - cpu
+
+    def add(self, counter, amount=1):
+        """Increment a counter (safe to call from worker threads)"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def observe_request(self, seconds, failed=False):
+        """Record one backend request (safe to call from worker threads)"""
+        with self._lock:
+            self.request_latency.observe(seconds)
+            self.counters['backend_requests'] += 1
+            if failed:
+                self.counters['backend_errors'] += 1
+
+    def to_dict(self):
+        """JSON-serializable summary returned with the translation result"""
+        lookups = self.counters['cache_hits'] + self.counters['cache_misses']
+        return {
+            'total_seconds': round(time.perf_counter() - self._started, 4),
+            'settings': dict(self.settings),
+            'stages': {
+                name: {'wall_seconds': round(t['wall'], 4), 'cpu_seconds': round(t['cpu'], 4)}
+                for name, t in self.stages.items()
+            },
+            'counters': dict(self.counters),
+            'cache_hit_rate': round(self.counters['cache_hits'] / lookups, 4) if lookups else 0.0,
+            'request_latency': self.request_latency.to_dict(),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """Process-wide totals across all jobs, exposed at /metrics"""
+        self.jobs = {'completed': 0, 'failed': 0}
+        self.stage_seconds = {}  # name -> [wall sum, cpu sum, count]
+        self.counters = {}
+        self.request_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def record_job(self, job_metrics, failed=False):
+        """Fold a finished job's metrics into the totals"""
+        with self._lock:
+            self.jobs['failed' if failed else 'completed'] += 1
+            for name, t in job_metrics.stages.items():
+                entry = self.stage_seconds.setdefault(name, [0.0, 0.0, 0])
+                entry[0] += t['wall']
+                entry[1] += t['cpu']
+                entry[2] += 1
+            for name, value in job_metrics.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.request_latency.merge(job_metrics.request_latency)
+
+    def render_prometheus(self):
+        """Render the totals in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP idml_jobs_total Translation jobs by outcome.')
+            lines.append('# TYPE idml_jobs_total counter')
+            for outcome, value in self.jobs.items():
+                lines.append(f'idml_jobs_total{{outcome="{outcome}"}} {value}')
+
+            lines.append('# HELP idml_stage_seconds_total Time spent per pipeline stage.')
+            lines.append('# TYPE idml_stage_seconds_total counter')
+            for name, (wall, cpu, _) in self.stage_seconds.items():
+                lines.append(f'idml_stage_seconds_total{{stage="{name}",clock="wall"}} {wall:.6f}')
+                lines.append(f'idml_stage_seconds_total{{stage="{name}",clock="cpu"}} {cpu:.6f}')
+
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE idml_{name}_total counter')
+                lines.append(f'idml_{name}_total {value}')
+
+            histogram = self.request_latency
+            lines.append('# HELP idml_backend_request_seconds Translation backend request latency.')
+            lines.append('# TYPE idml_backend_request_seconds histogram')
+            for bound, value in zip(histogram.buckets, histogram.counts):
+                lines.append(f'idml_backend_request_seconds_bucket{{le="{bound}"}} {value}')
+            lines.append(f'idml_backend_request_seconds_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f'idml_backend_request_seconds_sum {histogram.sum:.6f}')
+            lines.append(f'idml_backend_request_seconds_count {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,140 @@
+"""
+Resilient Client Policies
+Exponential backoff with jitter, a circuit breaker and an adaptive
+(AIMD) request rate for calls to a translation service
+"""
+
+import time
+import random
+import threading
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, seed=None):
+        """
+        Exponential backoff with full jitter
+
+        Args:
+            max_attempts: Total attempts per request, including the first one
+            base_delay: Upper bound of the first backoff in seconds
+            max_delay: Cap on any single backoff
+            seed: Random seed for reproducible delays
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt (1-based)"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return self._random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Stops sending requests after repeated failures
+
+        After failure_threshold consecutive failures the circuit opens and
+        every request is refused for reset_timeout seconds. Then a single
+        trial request is let through (half-open): success closes the
+        circuit, failure opens it again.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, initial_rate=10.0, min_rate=0.5, max_rate=100.0,
+                 increase=0.2, decrease=0.5, cooldown=1.0):
+        """
+        Request rate that adapts to the service (additive increase,
+        multiplicative decrease)
+
+        Every successful request raises the rate by increase requests per
+        second; a throttled request multiplies it by decrease. Throttles
+        within cooldown seconds of the last decrease come from the same
+        burst and only count once.
+
+        Args:
+            initial_rate: Starting requests per second
+            min_rate: Lowest rate the limiter backs off to
+            max_rate: Highest rate the limiter ramps up to
+            increase: Requests per second added per success
+            decrease: Factor applied to the rate on a throttle
+            cooldown: Seconds between two decreases
+        """
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._next_slot = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the current rate allows another request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # Push queued requests back so the slower rate applies immediately
+            self._next_slot = max(self._next_slot, now + 1.0 / self.rate)
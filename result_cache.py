@@ -0,0 +1,231 @@
+"""
+Job Result Cache
+Content-addressed store of finished translation jobs: the translated IDML,
+its segment manifest and, once built, the Word document, keyed by a hash of
+the input bytes and every setting that changes the output
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+DEFAULT_CACHE_PATH = os.path.join('cache', 'results')
+
+# Files kept per entry; the manifest also holds the translation pairs
+ENTRY_FILES = {
+    'idml': 'output.idml',
+    'manifest': 'output.segments.json',
+    'word': 'output.docx',
+}
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_job_key(input_hash, **settings):
+    """Build the cache key for an input file hash and the job settings"""
+    raw = json.dumps({'input': input_hash, **settings}, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _copy(source, target):
+    """
+    Copy a file through a temporary name so readers never see it half
+    written. The copy gets a fresh mtime, which keeps a restored Word
+    document newer than the IDML restored before it. Entries are copies
+    rather than hard links because output files are rewritten in place by
+    later jobs.
+    """
+    temp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+class ResultCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_PATH, max_bytes=2 * 1024 ** 3, max_entries=500):
+        """
+        Initialize the result cache
+
+        Args:
+            cache_dir: Folder holding one subfolder per cached job
+            max_bytes: Disk quota; least recently used entries are evicted above it
+            max_entries: Maximum number of cached jobs
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, output_paths):
+        """
+        Copy a cached job's files to its output paths
+
+        Args:
+            key: Job key from make_job_key
+            output_paths: Dict with 'idml', 'manifest' and 'word' target paths
+
+        Returns:
+            Dict of the files that were restored (the Word document is
+            missing if it was never built), or None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        idml = os.path.join(entry_dir, ENTRY_FILES['idml'])
+        manifest = os.path.join(entry_dir, ENTRY_FILES['manifest'])
+        if not (os.path.exists(idml) and os.path.exists(manifest)):
+            self.misses += 1
+            return None
+
+        restored = {}
+        try:
+            # IDML first, so a Word document restored after it stays current
+            for kind in ('idml', 'manifest', 'word'):
+                cached = os.path.join(entry_dir, ENTRY_FILES[kind])
+                target = str(output_paths[kind])
+                if os.path.exists(cached):
+                    _copy(cached, target)
+                    restored[kind] = target
+                elif kind == 'word' and os.path.exists(target):
+                    # Left by an earlier job at the same path; it describes other translations
+                    os.remove(target)
+            # The folder's mtime marks when the entry was last used
+            os.utime(entry_dir)
+        except OSError as e:
+            # Evicted by another process while it was being copied
+            print(f"Result cache read failed: {e}")
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return restored
+
+    def put(self, key, files):
+        """
+        Store the files of a finished job
+
+        Args:
+            key: Job key from make_job_key
+            files: Dict with 'idml' and 'manifest' paths, optionally 'word'
+        """
+        entry_dir = self._entry_dir(key)
+        staging_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(staging_dir, exist_ok=True)
+            for kind, path in files.items():
+                _copy(str(path), os.path.join(staging_dir, ENTRY_FILES[kind]))
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            # Readers see the whole entry or none of it
+            os.replace(staging_dir, entry_dir)
+            self.writes += 1
+        except OSError as e:
+            print(f"Result cache write failed: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+
+        self.prune()
+
+    def add_word_document(self, key, word_path):
+        """Add a Word document built later to an existing entry"""
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return
+        try:
+            _copy(str(word_path), os.path.join(entry_dir, ENTRY_FILES['word']))
+        except OSError as e:
+            print(f"Result cache write failed: {e}")
+
+    def _entries(self):
+        """(last used, size in bytes, path) of every entry, least recently used first"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def prune(self):
+        """Evict least recently used entries until the count and disk quota fit"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+                _, size, path = entries.pop(0)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached job"""
+        with self._lock:
+            for _, _, path in self._entries():
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        """Return hit/miss counters and disk usage for reporting"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Return the process-wide result cache, creating it on first use
+
+    Configured through environment variables:
+        RESULT_CACHE_PATH: Cache folder (default cache/results)
+        RESULT_CACHE_MAX_MB: Disk quota in megabytes (default 2048)
+        RESULT_CACHE_MAX_ENTRIES: Maximum number of cached jobs (default 500)
+        RESULT_CACHE_DISABLED: Set to 1 to always run the full pipeline
+    """
+    global _cache
+    if os.getenv('RESULT_CACHE_DISABLED') == '1':
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = ResultCache(
+                        cache_dir=os.getenv('RESULT_CACHE_PATH', DEFAULT_CACHE_PATH),
+                        max_bytes=int(float(os.getenv('RESULT_CACHE_MAX_MB', 2048)) * 1024 * 1024),
+                        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 500)),
+                    )
+                except OSError as e:
+                    print(f"Result cache disabled: {e}")
+                    return None
+    return _cache
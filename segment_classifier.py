@@ -0,0 +1,94 @@
+"""
+Segment Classifier
+Finds segments that do not need a translation request: numbers and prices,
+SKUs and codes, URLs, emails, punctuation and text already written in the
+target language's script
+"""
+
+import os
+import re
+from segmentation import RUN_MARKER_RE, strip_markers
+
+# Convert digits to the target language's digit forms in locally handled numbers
+CONVERT_DIGITS = os.getenv('TRANSLATION_CONVERT_DIGITS', '0') == '1'
+
+TRANSLATE = 'translate'
+NUMBER = 'number'
+PUNCTUATION = 'punctuation'
+URL = 'url'
+EMAIL = 'email'
+CODE = 'code'
+TARGET_SCRIPT = 'target_script'
+
+URL_RE = re.compile(r'^(https?://|www\.)\S+$', re.IGNORECASE)
+EMAIL_RE = re.compile(r'^[\w.+-]+@[\w-]+(\.[\w-]+)+$')
+# Upper-case product codes and SKUs with letters and digits, e.g. AB-1234, X200/B
+CODE_RE = re.compile(r'^(?=\S*\d)(?=\S*[A-Z])[A-Z0-9][A-Z0-9\-_/.#]*$')
+
+# Script of each target language, tested per alphabetic character
+SCRIPTS = {
+    'ar': re.compile('[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]'),
+    'en': re.compile('[A-Za-z\u00C0-\u024F]'),
+}
+
+WESTERN_DIGITS = '0123456789'
+ARABIC_INDIC_DIGITS = '\u0660\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669'
+DIGIT_TABLES = {
+    'ar': str.maketrans(WESTERN_DIGITS, ARABIC_INDIC_DIGITS),
+    'en': str.maketrans(ARABIC_INDIC_DIGITS, WESTERN_DIGITS),
+}
+
+
+def classify_segment(text, target_lang):
+    """
+    Decide whether a segment needs a translation request
+
+    Args:
+        text: Segment text (run markers are ignored)
+        target_lang: Target language code
+
+    Returns:
+        TRANSLATE, or the reason the segment is handled locally
+    """
+    plain = strip_markers(text)
+    if URL_RE.match(plain):
+        return URL
+    if EMAIL_RE.match(plain):
+        return EMAIL
+    if CODE_RE.match(plain):
+        return CODE
+
+    letters = [char for char in plain if char.isalpha()]
+    if not letters:
+        return NUMBER if any(char.isdigit() for char in plain) else PUNCTUATION
+
+    script = SCRIPTS.get(target_lang)
+    if script and all(script.match(char) for char in letters):
+        return TARGET_SCRIPT
+    return TRANSLATE
+
+
+def local_translation(text, kind, target_lang, convert_digits=CONVERT_DIGITS):
+    """
+    Result for a segment that is not sent to the backend
+
+    The text is kept as it is, except that numbers are converted to the
+    target language's digit forms when convert_digits is set. Run markers
+    are left untouched so the text still splits back across its runs.
+    """
+    table = DIGIT_TABLES.get(target_lang)
+    if kind != NUMBER or not convert_digits or table is None:
+        return text
+    return _convert_outside_markers(text, table)
+
+
+def _convert_outside_markers(text, table):
+    """Apply a digit table to everything except the run markers"""
+    pieces = []
+    position = 0
+    for marker in RUN_MARKER_RE.finditer(text):
+        pieces.append(text[position:marker.start()].translate(table))
+        pieces.append(marker.group(0))
+        position = marker.end()
+    pieces.append(text[position:].translate(table))
+    return ''.join(pieces)
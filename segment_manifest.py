@@ -0,0 +1,105 @@
+"""
+Segment Manifest
+Persists every translated segment of a job next to its output IDML, so edits,
+reloads and the review UI can find segments without re-parsing story XML
+"""
+
+import os
+import json
+import hashlib
+
+MANIFEST_VERSION = 1
+
+
+def text_hash(text):
+    """Short content hash used to detect changed source or target text"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def segment_id(story_id, path):
+    """Stable segment ID derived from the owning story and the element path"""
+    return hashlib.sha1(f"{story_id}|{path}".encode('utf-8')).hexdigest()[:16]
+
+
+def story_self_id(root):
+    """Return the Self ID of the Story element in a story tree"""
+    story = root.find('Story')
+    return story.get('Self', '') if story is not None else ''
+
+
+def element_path(tree, element):
+    """XPath of an element within its story tree"""
+    return tree.getpath(element)
+
+
+def find_element(tree, path):
+    """Resolve a path produced by element_path, or None if it no longer exists"""
+    namespaces = {prefix: uri for prefix, uri in tree.getroot().nsmap.items() if prefix}
+    matches = tree.xpath(path, namespaces=namespaces)
+    return matches[0] if matches else None
+
+
+def manifest_path_for(idml_path):
+    """Manifest file that belongs to an output IDML file"""
+    idml_path = str(idml_path)
+    if idml_path.endswith('.idml'):
+        idml_path = idml_path[:-len('.idml')]
+    return idml_path + '.segments.json'
+
+
+def write_manifest(idml_path, segments, source_file=None, target_lang=None, cache_key=None,
+                   stories=None):
+    """
+    Write the segment manifest next to an output IDML file
+
+    Args:
+        idml_path: Path to the output IDML file
+        segments: Translation pairs ('id', 'segment_id', 'story_file', 'story_id',
+            'path', 'element_index', 'original', 'translated')
+        source_file: Name of the source IDML file
+        target_lang: Target language code
+        cache_key: Result cache key of the job that produced the file
+        stories: Dict of story file -> fingerprint of its source XML, used
+            to find unchanged stories when a later revision is translated
+
+    Returns:
+        Path to the manifest file
+    """
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'idml': os.path.basename(str(idml_path)),
+        'source_file': source_file,
+        'target_lang': target_lang,
+        'cache_key': cache_key,
+        'stories': stories or {},
+        'segments': [
+            dict(segment,
+                 source_hash=text_hash(segment['original']),
+                 target_hash=text_hash(segment['translated']))
+            for segment in segments
+        ],
+    }
+
+    manifest_path = manifest_path_for(idml_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    return manifest_path
+
+
+def load_manifest(idml_path):
+    """
+    Load the segment manifest of an output IDML file
+
+    Returns:
+        Manifest dict, or None if the job has no manifest
+    """
+    manifest_path = manifest_path_for(idml_path)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def index_segments(segments):
+    """Map segment IDs to segments for constant-time lookup"""
+    return {segment['segment_id']: segment for segment in segments if 'segment_id' in segment}
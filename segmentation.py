@@ -0,0 +1,72 @@
+"""
+Paragraph Segmentation
+Joins the Content runs of a paragraph into one segment with inline run
+markers and splits the translation back across the runs
+"""
+
+import os
+import re
+
+# 'paragraph' translates each paragraph once; 'run' translates every Content element on its own
+SEGMENTATION_MODES = ('paragraph', 'run')
+DEFAULT_SEGMENTATION = os.getenv('TRANSLATION_SEGMENTATION', 'paragraph')
+
+# Placed between runs; the number lets us check every boundary came back in order
+RUN_MARKER = '⟦{}⟧'
+RUN_MARKER_RE = re.compile(r'\s*⟦\s*(\d+)\s*⟧\s*')
+MARKER_CHARS = ('⟦', '⟧')
+
+
+def can_join(text):
+    """True if a run text can be joined to others without clashing with the markers"""
+    return not any(char in text for char in MARKER_CHARS)
+
+
+def join_runs(texts):
+    """
+    Join run texts into one translatable string
+
+    Example: ['Buy ', 'now', ' online'] -> 'Buy ⟦1⟧now⟦2⟧ online'
+    """
+    joined = texts[0]
+    for number, text in enumerate(texts[1:], 1):
+        joined += RUN_MARKER.format(number) + text
+    return joined
+
+
+def strip_markers(text):
+    """Remove run markers, leaving a single space where one was"""
+    return re.sub(r' {2,}', ' ', RUN_MARKER_RE.sub(' ', text)).strip()
+
+
+def split_runs(translated, texts):
+    """
+    Split a translated paragraph back into one text per original run
+
+    Each part keeps the leading and trailing whitespace of the run it
+    replaces, so spacing between differently formatted runs survives.
+
+    Args:
+        translated: Translation of join_runs(texts)
+        texts: Original run texts
+
+    Returns:
+        List of texts, one per run, or None if the markers did not come
+        back complete and in order
+    """
+    if len(texts) == 1:
+        return [_keep_whitespace(texts[0], translated.strip())]
+
+    numbers = [int(n) for n in RUN_MARKER_RE.findall(translated)]
+    if numbers != list(range(1, len(texts))):
+        return None
+
+    parts = RUN_MARKER_RE.split(translated)[::2]
+    return [_keep_whitespace(text, part.strip()) for text, part in zip(texts, parts)]
+
+
+def _keep_whitespace(original, translated):
+    """Wrap translated in the leading/trailing whitespace of original"""
+    leading = original[:len(original) - len(original.lstrip())]
+    trailing = original[len(original.rstrip()):]
+    return f"{leading}{translated}{trailing}"
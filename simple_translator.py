@@ -3,10 +3,15 @@
 Simple Translation Module using FREE Google Translate
 Supports bidirectional translation (English ↔ Arabic)
 No API key required!
+
+Requests go through a pluggable backend (see translation_backends);
+Google Translate is the default.
 """
 
 import sys
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Fix Windows encoding issues (handle closed file gracefully)
 # Only apply when not running in Streamlit (Streamlit manages its own streams)
@@ -21,9 +26,28 @@ if sys.platform == 'win32' and not hasattr(sys.stdout, '_is_wrapped'):
     except (ValueError, AttributeError, OSError):
         pass  # Ignore if already closed or no buffer
 
-from deep_translator import GoogleTranslator
+from translation_memory import get_translation_memory
+from translation_backends import get_backend, BATCH_SEPARATOR, BatchSplitError, HardFailureError
+
+# Google Translate rejects payloads of 5000 characters or more
+MAX_BATCH_CHARS = 4500
+
+
+def _timed_request(metrics, request, *args):
+    """Call a backend request method, recording its latency in metrics if given"""
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = request(*args)
+        failed = False
+        return result
+    finally:
+        if metrics is not None:
+            metrics.observe_request(time.perf_counter() - started, failed=failed)
+
 
-def translate_text(text, target_lang='ar', source_lang='auto'):
+def translate_text(text, target_lang='ar', source_lang='auto', use_cache=True, metrics=None,
+                   backend=None, strict=False):
     """
     Translate text to target language using free Google Translate
     
@@ -31,6 +55,12 @@ def translate_text(text, target_lang='ar', source_lang='auto'):
         text: Text to translate
         target_lang: Target language code ('ar' for Arabic, 'en' for English)
         source_lang: Source language code ('auto' for auto-detect)
+        use_cache: Look up and store the result in the translation memory
+        metrics: Optional metrics.JobMetrics that records the request
+        backend: Optional TranslationBackend (defaults to TRANSLATION_BACKEND / Google)
+        strict: Raise when the backend is throttling, timing out or down
+            instead of returning the original text; only input the service
+            rejects (hard failures) is still returned untranslated
     
     Returns:
         Translated text
@@ -39,16 +69,190 @@ def translate_text(text, target_lang='ar', source_lang='auto'):
         if not text or not text.strip():
             return text
         
-        # Use Google Translate (free, no API key needed)
-        translator = GoogleTranslator(source=source_lang, target=target_lang)
-        translated = translator.translate(text)
+        backend = backend or get_backend()
+        
+        # Check the translation memory before going to the network
+        memory = get_translation_memory() if use_cache else None
+        if memory is not None:
+            cached = memory.get(text, source_lang, target_lang, backend.name)
+            if cached is not None:
+                return cached
+        
+        translated = _timed_request(metrics, backend.translate, text, target_lang, source_lang)
+        
+        # Only successful translations are remembered
+        if memory is not None and translated:
+            memory.put(text, translated, source_lang, target_lang, backend.name)
         
         return translated
+    except HardFailureError as e:
+        print(f"Segment left untranslated: {e}")
+        if metrics is not None:
+            metrics.add('untranslated_segments')
+        return text
     except Exception as e:
+        if strict:
+            raise
         # Silently return original text if translation fails
         return text
 
 
+def pack_batches(texts, max_chars=MAX_BATCH_CHARS):
+    """
+    Group texts into batches whose joined length stays under max_chars
+    
+    Texts that contain the separator or are too long on their own are
+    placed in a batch of one.
+    
+    Returns:
+        List of lists of texts, in input order
+    """
+    batches = []
+    current = []
+    current_len = 0
+    
+    for text in texts:
+        if BATCH_SEPARATOR in text or len(text) >= max_chars:
+            if current:
+                batches.append(current)
+                current = []
+                current_len = 0
+            batches.append([text])
+            continue
+        
+        if current and current_len + len(BATCH_SEPARATOR) + len(text) > max_chars:
+            batches.append(current)
+            current = []
+            current_len = 0
+        current_len += len(text) + (len(BATCH_SEPARATOR) if current else 0)
+        current.append(text)
+    
+    if current:
+        batches.append(current)
+    return batches
+
+
+def translate_packed_batch(texts, target_lang='ar', source_lang='auto', metrics=None, backend=None):
+    """
+    Translate one packed batch with a single request
+    
+    Falls back to one request per text if the response does not split
+    back into the same number of segments or the service rejects the batch.
+    
+    Returns:
+        List of translated texts (the original text where the service
+        rejected a segment)
+    
+    Raises:
+        BackendError: If the backend is still failing after retries
+    """
+    backend = backend or get_backend()
+    if len(texts) == 1:
+        return [translate_text(texts[0], target_lang, source_lang, use_cache=False,
+                               metrics=metrics, backend=backend, strict=True)]
+    
+    try:
+        return _timed_request(metrics, backend.translate_batch, texts, target_lang, source_lang)
+    except BatchSplitError as e:
+        print(f"{e}, translating individually")
+    except HardFailureError as e:
+        print(f"Batch rejected ({e}), translating individually")
+    
+    return [translate_text(t, target_lang, source_lang, use_cache=False, metrics=metrics,
+                           backend=backend, strict=True) for t in texts]
+
+
+def translate_batch(texts, target_lang='ar', source_lang='auto', use_cache=True,
+                    max_chars=None, progress_callback=None, max_workers=1,
+                    metrics=None, backend=None):
+    """
+    Translate many texts with as few requests as possible
+    
+    Cached texts are served from the translation memory; the remaining texts
+    are packed into size-bounded batches, one request per batch. With
+    max_workers > 1 up to that many batch requests are kept in flight.
+    Batches are submitted in input order, so callers put the texts they
+    want finished first at the front.
+    
+    Args:
+        texts: List of texts to translate (should already be deduplicated)
+        target_lang: Target language code
+        source_lang: Source language code
+        use_cache: Use the translation memory
+        max_chars: Maximum characters per request (defaults to the backend's limit)
+        progress_callback: Optional callback(done, total) after each batch,
+            always called from the calling thread
+        max_workers: Number of concurrent requests
+        metrics: Optional metrics.JobMetrics for request latency and cache hits
+        backend: Optional TranslationBackend (defaults to TRANSLATION_BACKEND / Google)
+    
+    Returns:
+        List of translated texts in the same order as texts
+    
+    Raises:
+        BackendError: If the backend is throttling, timing out or down after
+            retries. Batches finished before the failure are already in the
+            translation memory, so a rerun only sends the rest.
+    """
+    backend = backend or get_backend()
+    for lang in (source_lang, target_lang):
+        if not backend.supports(lang):
+            raise Exception(f"Backend '{backend.name}' does not support language: {lang}")
+    max_chars = max_chars or backend.max_payload_chars
+    
+    results = list(texts)
+    memory = get_translation_memory() if use_cache else None
+    
+    # Serve what we can from the translation memory
+    pending = []
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        cached = memory.get(text, source_lang, target_lang, backend.name) if memory is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+    
+    done = len(texts) - len(pending)
+    if metrics is not None and memory is not None:
+        metrics.add('cache_hits', done)
+        metrics.add('cache_misses', len(pending))
+    if progress_callback:
+        progress_callback(done, len(texts))
+    
+    # Remember where each batch starts in the pending list
+    batches = []
+    offset = 0
+    for batch in pack_batches([texts[i] for i in pending], max_chars):
+        batches.append((offset, batch))
+        offset += len(batch)
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {
+            pool.submit(translate_packed_batch, batch, target_lang, source_lang, metrics, backend):
+                (offset, batch)
+            for offset, batch in batches
+        }
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                # Don't start batches that can no longer complete the job
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise future.exception()
+            offset, batch = futures[future]
+            for position, (text, result) in enumerate(zip(batch, future.result())):
+                results[pending[offset + position]] = result
+                # Untranslated fallbacks are not remembered
+                if memory is not None and result and result != text:
+                    memory.put(text, result, source_lang, target_lang, backend.name)
+            
+            done += len(batch)
+            if progress_callback:
+                progress_callback(done, len(texts))
+    
+    return results
+
+
 def translate_to_arabic(text):
     """Translate text to Arabic (backward compatibility)"""
     return translate_text(text, target_lang='ar', source_lang='auto')
@@ -134,9 +134,7 @@ async function handleTranslate() {
     hideDownloadButtons();
     
     try {
-        // Simulate progress (since we can't get real-time progress from the backend easily)
-        simulateProgress();
-        
+        // Upload the file; the server queues it and returns a job ID right away
         const response = await fetch('/api/translate', {
             method: 'POST',
             body: formData
@@ -147,13 +145,15 @@ async function handleTranslate() {
             throw new Error(error.error || 'Translation failed');
         }
         
-        // Get JSON response with both file names
-        const data = await response.json();
+        const job = await response.json();
         
-        if (!data.success) {
+        if (!job.success) {
             throw new Error('Translation failed');
         }
         
+        // Poll the job until it finishes, showing real progress
+        const data = await pollJob(job.status_url);
+        
         // Create download buttons for both files
         showDownloadButtons(data.idml_file, data.word_file);
         
@@ -173,28 +173,28 @@ async function handleTranslate() {
     }
 }
 
-function simulateProgress() {
-    const stages = [
-        { label: 'Extracting IDML file...', progress: 10 },
-        { label: 'Applying Arabic formatting rules...', progress: 20 },
-        { label: 'Translating text content...', progress: 40 },
-        { label: 'Processing translation...', progress: 60 },
-        { label: 'Mapping fonts for Arabic...', progress: 80 },
-        { label: 'Reconstructing IDML file...', progress: 90 },
-        { label: 'Generating Word document...', progress: 95 }
-    ];
-    
-    let currentStage = 0;
-    
-    const interval = setInterval(() => {
-        if (currentStage < stages.length) {
-            const stage = stages[currentStage];
-            updateProgress(stage.label, stage.progress);
-            currentStage++;
-        } else {
-            clearInterval(interval);
+const POLL_INTERVAL_MS = 1000;
+
+async function pollJob(statusUrl) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const data = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(data.error || 'Translation failed');
+        }
+        
+        updateProgress(data.message, data.progress);
+        
+        if (data.status === 'completed') {
+            return data;
         }
-    }, 2000);
+        if (data.status === 'failed') {
+            throw new Error(data.error || 'Translation failed');
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
 }
 
 function updateProgress(label, progress) {
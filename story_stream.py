@@ -0,0 +1,193 @@
+"""
+Streaming XML Rewriter
+Walks large IDML members with iterparse and writes them back with lxml's
+incremental writer, so memory is bounded by the largest top-level element
+(usually one paragraph) instead of the whole document
+"""
+
+from lxml import etree
+
+# Depth of the elements handled as complete subtrees ("granules"): in a story
+# these are the children of <Story>, i.e. the top-level ParagraphStyleRanges
+GRANULE_DEPTH = 2
+
+
+def _qname(element):
+    """Step name as it appears in lxml's getpath()"""
+    tag = element.tag
+    if tag[0] != '{':
+        return tag
+    prefix = element.prefix
+    local = etree.QName(tag).localname
+    return f'{prefix}:{local}' if prefix else local
+
+
+class StreamPosition:
+    def __init__(self, parent, qname, number):
+        """Position of a container or granule; path() is final once the stream has ended"""
+        self.parent = parent
+        self.qname = qname
+        self.number = number  # 1-based among siblings with the same name
+        self.child_counts = {}
+
+    def path(self, relative=''):
+        """
+        Path compatible with tree.getpath(), optionally extended by a path
+        relative to this element (see relative_path)
+        """
+        steps = []
+        position = self
+        while position is not None:
+            step = position.qname
+            if position.parent is not None and position.parent.child_counts.get(step, 0) > 1:
+                step += f'[{position.number}]'
+            steps.append(step)
+            position = position.parent
+        return '/' + '/'.join(reversed(steps)) + relative
+
+
+class ElementRecord:
+    __slots__ = ('text', 'position', 'relative')
+
+    def __init__(self, text, position, relative):
+        """Text and location of an element whose granule has already been dropped"""
+        self.text = text
+        self.position = position
+        self.relative = relative
+
+    @property
+    def path(self):
+        return self.position.path(self.relative)
+
+
+def relative_path(granule, element):
+    """getpath()-style path of element below a complete granule"""
+    steps = []
+    while element is not granule:
+        parent = element.getparent()
+        siblings = list(parent.iterchildren(element.tag))
+        step = _qname(element)
+        if len(siblings) > 1:
+            step += f'[{siblings.index(element) + 1}]'
+        steps.append(step)
+        element = parent
+    return ''.join('/' + step for step in reversed(steps))
+
+
+def stream_xml(source, process_granule, process_container=None, output=None,
+               granule_depth=GRANULE_DEPTH):
+    """
+    Walk an XML document one granule at a time, optionally rewriting it
+
+    process_granule(element, position) is called for every granule once its
+    subtree is complete. process_container(element, position) is called for
+    every element above granule_depth when it starts; only its attributes
+    may be used, since iterparse may or may not have added children yet.
+    Changes made to the elements are written out. Each granule is written
+    and dropped once its tail text has been read.
+
+    Args:
+        source: File object or path of the XML document
+        process_granule: Callback(element, StreamPosition)
+        process_container: Optional callback(element, StreamPosition)
+        output: Binary file object for the rewritten document, or None to
+            only scan
+        granule_depth: Depth of the elements handled as complete subtrees
+
+    Returns:
+        StreamPosition of the root element
+    """
+    xf_context = etree.xmlfile(output, encoding='UTF-8') if output is not None else None
+    xf = xf_context.__enter__() if xf_context is not None else None
+    if xf is not None:
+        xf.write_declaration()
+
+    frames = []  # open containers: [element, position, writer context, text written, pending]
+    depth = 0
+    root_position = None
+
+    def flush(frame):
+        """Write the finished child whose tail has now been read, and drop it"""
+        pending = frame[4]
+        if pending is None:
+            return
+        frame[4] = None
+        node, closed_container = pending
+        # Detached first, so the node only declares the namespaces it uses
+        parent = node.getparent()
+        if parent is not None:
+            parent.remove(node)
+        if xf is not None:
+            if closed_container:
+                if node.tail:
+                    xf.write(node.tail)
+            else:
+                xf.write(node)
+
+    def open_child(frame):
+        """Write the parent's text and previous child before a new child starts"""
+        if not frame[3]:
+            frame[3] = True
+            if xf is not None and frame[0].text:
+                xf.write(frame[0].text)
+        flush(frame)
+
+    try:
+        for event, node in etree.iterparse(source, events=('start', 'end', 'comment', 'pi'),
+                                           remove_blank_text=False):
+            if event == 'start':
+                if depth < granule_depth:
+                    parent = frames[-1] if frames else None
+                    qname = _qname(node)
+                    if parent is not None:
+                        open_child(parent)
+                        counts = parent[1].child_counts
+                        counts[qname] = counts.get(qname, 0) + 1
+                        position = StreamPosition(parent[1], qname, counts[qname])
+                    else:
+                        position = root_position = StreamPosition(None, qname, 1)
+
+                    if process_container is not None:
+                        process_container(node, position)
+
+                    context = None
+                    if xf is not None:
+                        inherited = parent[0].nsmap if parent is not None else {}
+                        nsmap = {prefix: uri for prefix, uri in node.nsmap.items()
+                                 if inherited.get(prefix) != uri}
+                        context = xf.element(node.tag, dict(node.attrib), nsmap=nsmap or None)
+                        context.__enter__()
+                    frames.append([node, position, context, False, None])
+                elif depth == granule_depth:
+                    open_child(frames[-1])
+                depth += 1
+
+            elif event == 'end':
+                depth -= 1
+                if depth == granule_depth:
+                    frame = frames[-1]
+                    counts = frame[1].child_counts
+                    qname = _qname(node)
+                    counts[qname] = counts.get(qname, 0) + 1
+                    process_granule(node, StreamPosition(frame[1], qname, counts[qname]))
+                    frame[4] = (node, False)
+                elif depth < granule_depth:
+                    frame = frames.pop()
+                    open_child(frame)
+                    if frame[2] is not None:
+                        frame[2].__exit__(None, None, None)
+                    if frames:
+                        frames[-1][4] = (node, True)
+
+            elif depth <= granule_depth:
+                # Comment or processing instruction outside any granule
+                if frames:
+                    open_child(frames[-1])
+                    frames[-1][4] = (node, False)
+                elif xf is not None:
+                    xf.write(node)
+    finally:
+        if xf_context is not None:
+            xf_context.__exit__(None, None, None)
+
+    return root_position
@@ -4,11 +4,16 @@ Professional translation for Adobe InDesign files with beautiful animations
 """
 
 import streamlit as st
+import pandas as pd
 import os
+import re
 import tempfile
 import time
-from pathlib import Path
-from translator_core import IDMLTranslator
+from job_queue import JobManager, upload_name, display_name
+from translator_core import ensure_word_document, word_document_is_current
+
+# Row counts offered by the review grid
+PAGE_SIZES = [50, 100, 250, 500]
 
 # Page configuration
 st.set_page_config(
@@ -29,10 +34,20 @@ if 'output_paths' not in st.session_state:
     st.session_state.output_paths = None
 if 'translations' not in st.session_state:
     st.session_state.translations = []
-if 'current_segment' not in st.session_state:
-    st.session_state.current_segment = 0
+if 'editor_version' not in st.session_state:
+    st.session_state.editor_version = 0
 if 'translation_complete' not in st.session_state:
     st.session_state.translation_complete = False
+if 'job_id' not in st.session_state:
+    # A running job survives a browser refresh through the ?job= URL parameter
+    st.session_state.job_id = st.query_params.get('job')
+    if st.session_state.job_id:
+        st.session_state.step = 2
+
+# Background translation workers shared by every session on this server
+@st.cache_resource
+def get_job_manager():
+    return JobManager(max_workers=int(os.getenv('TRANSLATION_WORKERS', 2)))
 
 # Enhanced CSS with animations
 st.markdown("""
@@ -346,6 +361,89 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Word download, built from the translated IDML the first time it is requested
+def show_word_download(key, **button_args):
+    idml_path = st.session_state.output_paths['idml']
+    word_path = st.session_state.output_paths['word']
+    
+    if word_document_is_current(idml_path, word_path):
+        with open(word_path, 'rb') as f:
+            st.download_button(
+                label="📝 Download Word Document",
+                data=f.read(),
+                file_name=display_name(word_path),
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                use_container_width=True,
+                key=key,
+                **button_args
+            )
+    elif st.button("📝 Prepare Word Document", use_container_width=True, key=f"prepare_{key}", **button_args):
+        with st.spinner("Generating Word document..."):
+            ensure_word_document(idml_path, word_path)
+        st.rerun()
+
+# Progress of the session's background job, polled without rerunning the whole page
+@st.fragment(run_every=1.0)
+def show_job_progress():
+    job = get_job_manager().get(st.session_state.job_id)
+    if job is None:
+        st.warning("This translation job is no longer available. Please start it again.")
+        st.session_state.job_id = None
+        st.query_params.pop('job', None)
+        return
+    
+    st.progress(job.progress / 100)
+    st.markdown(f"**{job.message}** ({job.progress}%)")
+    
+    if job.status == 'completed':
+        # Attach the finished job to this session and redraw the page
+        st.session_state.output_paths = job.result
+        st.session_state.translations = job.result.get('translations', [])
+        st.session_state.target_lang = job.target_lang
+        st.session_state.translation_complete = True
+        st.session_state.job_id = None
+        st.rerun()
+    elif job.status == 'failed':
+        st.error(f"❌ Translation failed: {job.error}")
+        st.session_state.job_id = None
+        st.query_params.pop('job', None)
+
+# Review statistics, computed once per set of translations and then kept up
+# to date segment by segment by update_segment()
+def get_review_stats():
+    translations = st.session_state.translations
+    stats = st.session_state.get('review_stats')
+    if stats is None or stats['source'] != id(translations):
+        stats = st.session_state.review_stats = {
+            'source': id(translations),
+            'segments': len(translations),
+            'original_words': sum(len(t['original'].split()) for t in translations),
+            'translated_words': sum(len(t['translated'].split()) for t in translations),
+            'translated_chars': sum(len(t['translated']) for t in translations),
+            'edited': 0,
+            'originals': {},  # index -> translation before this review
+        }
+    return stats
+
+def update_segment(index, new_text):
+    """Store an edited translation and adjust the statistics by the difference"""
+    segment = st.session_state.translations[index]
+    old_text = segment['translated']
+    if new_text == old_text:
+        return False
+    
+    stats = get_review_stats()
+    stats['translated_words'] += len(new_text.split()) - len(old_text.split())
+    stats['translated_chars'] += len(new_text) - len(old_text)
+    originals = stats['originals']
+    if index not in originals:
+        originals[index] = old_text
+    elif new_text == originals[index]:
+        del originals[index]
+    stats['edited'] = len(originals)
+    segment['translated'] = new_text
+    return True
+
 # Progress Stepper with enhanced animations
 def show_stepper(current_step):
     steps = [
@@ -491,52 +589,24 @@ elif st.session_state.step == 2:
         st.info(f"🌐 **Target:** {'Arabic (العربية)' if st.session_state.target_lang == 'ar' else 'English'}")
     
     if not st.session_state.translation_complete:
-        if st.button("✨ Start Translation", type="primary", use_container_width=True):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
+        if st.session_state.job_id:
+            show_job_progress()
+        elif st.session_state.uploaded_file and st.button("✨ Start Translation", type="primary", use_container_width=True):
             try:
-                # Save uploaded file to temp location
-                temp_path = os.path.join(tempfile.gettempdir(), f"upload_{st.session_state.uploaded_file.name}")
+                # Save the upload under a unique name; the worker removes it when done
+                uploaded = st.session_state.uploaded_file
+                temp_path = os.path.join(tempfile.gettempdir(), upload_name(uploaded.name))
                 with open(temp_path, 'wb') as f:
-                    f.write(st.session_state.uploaded_file.getvalue())
-                    f.flush()  # Ensure data is written to disk
-                    os.fsync(f.fileno())  # Force write to disk
-                
-                # Small delay to ensure file system has processed the write
-                time.sleep(0.1)
-                
-                def update_progress(message, percentage):
-                    progress_bar.progress(percentage / 100)
-                    status_text.markdown(f"**{message}** ({percentage}%)")
-                
-                translator = IDMLTranslator(target_lang=st.session_state.target_lang)
-                output_paths = translator.translate_idml(temp_path, update_progress)
+                    f.write(uploaded.getvalue())
                 
-                st.session_state.output_paths = output_paths
-                st.session_state.translations = output_paths.get('translations', [])
-                st.session_state.translation_complete = True
-                
-                os.remove(temp_path)
-                
-                progress_bar.progress(100)
-                status_text.markdown("**✅ Translation complete!**")
-                
-                # Success animation
-                st.markdown('''
-                <svg class="success-checkmark" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 52 52">
-                    <circle class="checkmark__circle" cx="26" cy="26" r="25" fill="none"/>
-                    <path class="checkmark__check" fill="none" d="M14.1 27.2l7.1 7.2 16.7-16.8"/>
-                </svg>
-                ''', unsafe_allow_html=True)
-                
-                time.sleep(1)
+                # Queue the job on the shared workers; this script returns immediately
+                job = get_job_manager().submit(temp_path, uploaded.name, st.session_state.target_lang)
+                st.session_state.job_id = job.id
+                st.query_params['job'] = job.id
                 st.rerun()
                     
             except Exception as e:
                 st.error(f"❌ Translation failed: {str(e)}")
-                progress_bar.empty()
-                status_text.empty()
     
     # After translation - offer to edit or download
     if st.session_state.translation_complete and st.session_state.output_paths:
@@ -566,6 +636,11 @@ elif st.session_state.step == 2:
         with col4:
             st.metric("Characters", total_chars)
         
+        skipped_segments = sum(1 for t in st.session_state.translations if t.get('skipped'))
+        if skipped_segments:
+            st.caption(f"{skipped_segments} segments (numbers, codes, URLs, emails and text already "
+                       f"in the target language) were kept without a translation request")
+        
         st.markdown("<br>", unsafe_allow_html=True)
         
         st.markdown("### 🎯 Next Steps")
@@ -581,6 +656,7 @@ elif st.session_state.step == 2:
             if st.button("🔄 Translate Another File", use_container_width=True, key="translate_another_top"):
                 st.session_state.step = 1
                 st.session_state.translation_complete = False
+                st.query_params.pop('job', None)
                 st.session_state.uploaded_file = None
                 st.session_state.output_paths = None
                 st.session_state.translations = []
@@ -597,25 +673,19 @@ elif st.session_state.step == 2:
                 st.download_button(
                     label="📄 Download IDML File",
                     data=f.read(),
-                    file_name=Path(st.session_state.output_paths['idml']).name,
+                    file_name=display_name(st.session_state.output_paths['idml']),
                     mime="application/octet-stream",
                     use_container_width=True
                 )
         
         with col2:
-            with open(st.session_state.output_paths['word'], 'rb') as f:
-                st.download_button(
-                    label="📝 Download Word Document",
-                    data=f.read(),
-                    file_name=Path(st.session_state.output_paths['word']).name,
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True
-                )
+            show_word_download("download_word")
         
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🔄 Translate Another File", use_container_width=True, key="translate_another_bottom"):
             st.session_state.step = 1
             st.session_state.translation_complete = False
+            st.query_params.pop('job', None)
             st.session_state.uploaded_file = None
             st.session_state.output_paths = None
             st.rerun()
@@ -636,49 +706,86 @@ elif st.session_state.step == 4:
             st.session_state.step = 3
             st.rerun()
     else:
-        total_segments = len(st.session_state.translations)
+        translations = st.session_state.translations
         
-        # Navigation
-        col1, col2, col3 = st.columns([1, 2, 1])
+        # Filter and page through the segments; only one page is sent to the browser
+        col1, col2, col3 = st.columns([3, 1, 1])
         
         with col1:
-            if st.button("← Previous", disabled=st.session_state.current_segment == 0):
-                st.session_state.current_segment = max(0, st.session_state.current_segment - 1)
-                st.rerun()
+            search = st.text_input("🔍 Filter segments", placeholder="Text in the original or translation")
+        
+        if search:
+            needle = search.lower()
+            indices = [i for i, t in enumerate(translations)
+                       if needle in t['original'].lower() or needle in t['translated'].lower()]
+        else:
+            indices = range(len(translations))
         
         with col2:
-            st.markdown(f"<div style='text-align: center;'><strong>Segment {st.session_state.current_segment + 1} of {total_segments}</strong></div>", unsafe_allow_html=True)
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
         
+        page_count = max(1, -(-len(indices) // page_size))
         with col3:
-            if st.button("Next →", disabled=st.session_state.current_segment >= total_segments - 1):
-                st.session_state.current_segment = min(total_segments - 1, st.session_state.current_segment + 1)
-                st.rerun()
-        
-        st.markdown("---")
-        
-        # Current segment
-        current = st.session_state.translations[st.session_state.current_segment]
-        
-        col1, col2 = st.columns(2)
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1,
+                                   key=f"page_{search}_{page_size}")
+        
+        st.caption(f"{len(indices)} of {len(translations)} segments • page {page} of {page_count}")
+        
+        page_indices = list(indices[(page - 1) * page_size:page * page_size])
+        page_rows = pd.DataFrame({
+            'id': [translations[i]['id'] for i in page_indices],
+            'original': [translations[i]['original'] for i in page_indices],
+            'translated': [translations[i]['translated'] for i in page_indices],
+            'note': [translations[i].get('skipped', '') for i in page_indices],
+        }, index=page_indices)
+        
+        edited_rows = st.data_editor(
+            page_rows,
+            key=f"segments_{st.session_state.editor_version}_{search}_{page_size}_{page}",
+            disabled=['id', 'original', 'note'],
+            hide_index=True,
+            use_container_width=True,
+            num_rows="fixed",
+            column_config={
+                'id': st.column_config.NumberColumn("#", width="small"),
+                'original': st.column_config.TextColumn("Original", width="large"),
+                'translated': st.column_config.TextColumn("Translation", width="large"),
+                'note': st.column_config.TextColumn("Kept as is", width="small"),
+            },
+        )
         
-        with col1:
-            st.markdown("**Original:**")
-            st.info(current['original'])
+        # Only the rows of this page can have changed
+        changed = [update_segment(index, new_text or '')
+                   for index, new_text in edited_rows['translated'].items()]
+        if any(changed):
+            # The edits are stored; a fresh grid keeps them from being replayed on other
+            # rows, and is drawn now so the next edit doesn't land in the old one
+            st.session_state.editor_version += 1
+            st.rerun()
         
-        with col2:
-            st.markdown("**Translation:**")
-            edited_text = st.text_area(
-                "Edit",
-                value=current['translated'],
-                height=150,
-                key=f"edit_{st.session_state.current_segment}",
-                label_visibility="collapsed"
-            )
-            
-            if edited_text != current['translated']:
-                if st.button("💾 Save", type="primary"):
-                    st.session_state.translations[st.session_state.current_segment]['translated'] = edited_text
-                    st.success("✅ Saved!")
+        # === BATCH EDITS ===
+        with st.expander("🔁 Find & Replace"):
+            with st.form("find_replace"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    find_text = st.text_input("Find")
+                with col2:
+                    replace_text = st.text_input("Replace with")
+                match_case = st.checkbox("Match case")
+                scope = st.radio("Apply to", ["Filtered segments", "All segments"], horizontal=True)
+                
+                if st.form_submit_button("Replace All", type="primary") and find_text:
+                    pattern = re.compile(re.escape(find_text), 0 if match_case else re.IGNORECASE)
+                    targets = indices if scope == "Filtered segments" else range(len(translations))
+                    changed = 0
+                    for index in targets:
+                        new_text = pattern.sub(lambda match: replace_text, translations[index]['translated'])
+                        if update_segment(index, new_text):
+                            changed += 1
+                    
+                    # New editor key, so the grid shows the replaced text instead of older cell edits
+                    st.session_state.editor_version += 1
+                    st.success(f"✅ Replaced in {changed} segments")
                     time.sleep(0.3)
                     st.rerun()
         
@@ -687,24 +794,24 @@ elif st.session_state.step == 4:
         # === TRANSLATION STATISTICS ===
         st.markdown("### 📊 Translation Statistics")
         
-        total_segments = len(st.session_state.translations)
-        total_original_words = sum(len(t['original'].split()) for t in st.session_state.translations)
-        total_translated_words = sum(len(t['translated'].split()) for t in st.session_state.translations)
-        total_translated_chars = sum(len(t['translated']) for t in st.session_state.translations)
+        stats = get_review_stats()
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("Segments", total_segments)
+            st.metric("Segments", stats['segments'])
         
         with col2:
-            st.metric("Original Words", total_original_words)
+            st.metric("Original Words", stats['original_words'])
         
         with col3:
-            st.metric("Translated Words", total_translated_words)
+            st.metric("Translated Words", stats['translated_words'])
         
         with col4:
-            st.metric("Characters", total_translated_chars)
+            st.metric("Characters", stats['translated_chars'])
+        
+        if stats['edited']:
+            st.caption(f"{stats['edited']} segments edited in this review")
         
         # === DOWNLOAD SECTION ===
         st.markdown("---")
@@ -713,73 +820,24 @@ elif st.session_state.step == 4:
         if st.button("🔄 Apply All Edits to Files", type="primary", use_container_width=True, key="apply_edits_step4"):
             with st.spinner("Applying your edits to files..."):
                 try:
-                    import tempfile
-                    import zipfile
-                    import shutil
-                    from lxml import etree
-                    from word_generator import create_word_document
+                    from translator_core import apply_edits_to_idml, word_path_for
                     
                     # Get original IDML path and convert to absolute
                     original_idml = st.session_state.output_paths.get('idml')
                     if not os.path.isabs(original_idml):
                         original_idml = os.path.abspath(original_idml)
                     
-                    # Create temp directory for editing
-                    edit_temp_dir = tempfile.mkdtemp()
-                    
-                    # Extract IDML
-                    with zipfile.ZipFile(original_idml, 'r') as zip_ref:
-                        zip_ref.extractall(edit_temp_dir)
-                    
-                    # Apply edits to Story XML files
-                    stories_dir = os.path.join(edit_temp_dir, 'Stories')
-                    
-                    for translation in st.session_state.translations:
-                        # Skip if no story_file or element_index
-                        if 'story_file' not in translation or 'element_index' not in translation:
-                            continue
-                        
-                        story_file = translation['story_file']
-                        element_idx = translation['element_index']
-                        new_text = translation['translated']
-                        
-                        # Parse and update the story file
-                        story_path = os.path.join(stories_dir, story_file)
-                        if not os.path.exists(story_path):
-                            continue
-                        
-                        parser = etree.XMLParser(remove_blank_text=False)
-                        tree = etree.parse(story_path, parser)
-                        root = tree.getroot()
-                        
-                        # Update the specific Content element
-                        for idx, content in enumerate(root.iter('Content')):
-                            if idx == element_idx and content.text:
-                                content.text = new_text
-                                break
-                        
-                        # Write back
-                        tree.write(story_path, encoding='UTF-8', xml_declaration=True, pretty_print=False)
-                    
-                    # Reconstruct edited IDML
-                    edited_idml_path = original_idml.replace('.idml', '_edited.idml')
-                    with zipfile.ZipFile(edited_idml_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                        for root_dir, dirs, files in os.walk(edit_temp_dir):
-                            for file in files:
-                                file_path = os.path.join(root_dir, file)
-                                arcname = os.path.relpath(file_path, edit_temp_dir)
-                                zipf.write(file_path, arcname)
+                    # Apply edits, one parse and write per changed story
+                    edits_map = {t['id']: t['translated'] for t in st.session_state.translations}
+                    edited_idml_path = apply_edits_to_idml(
+                        original_idml, st.session_state.translations, edits_map
+                    )
                     
                     # Update session state with edited IDML
                     st.session_state.output_paths['idml'] = edited_idml_path
                     
-                    # Generate Word document from edited IDML
-                    word_output_path = edited_idml_path.replace('.idml', '.docx')
-                    edited_word = create_word_document(edit_temp_dir, word_output_path)
-                    st.session_state.output_paths['word'] = edited_word
-                    
-                    # Clean up temp directory
-                    shutil.rmtree(edit_temp_dir)
+                    # The Word document for the edited IDML is built on download
+                    st.session_state.output_paths['word'] = word_path_for(edited_idml_path)
                     
                     st.success("✅ All edits applied to files!")
                     time.sleep(1)
@@ -799,7 +857,7 @@ elif st.session_state.step == 4:
                 st.download_button(
                     label="📄 Download IDML File",
                     data=f.read(),
-                    file_name=Path(st.session_state.output_paths['idml']).name,
+                    file_name=display_name(st.session_state.output_paths['idml']),
                     mime="application/octet-stream",
                     use_container_width=True,
                     type="primary",
@@ -807,16 +865,7 @@ elif st.session_state.step == 4:
                 )
         
         with col2:
-            with open(st.session_state.output_paths['word'], 'rb') as f:
-                st.download_button(
-                    label="📝 Download Word Document",
-                    data=f.read(),
-                    file_name=Path(st.session_state.output_paths['word']).name,
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True,
-                    type="primary",
-                    key="download_word_edit"
-                )
+            show_word_download("download_word_edit", type="primary")
         
         # === NAVIGATION ===
         st.markdown("---")
@@ -832,6 +881,7 @@ elif st.session_state.step == 4:
             if st.button("🔄 Translate Another File", use_container_width=True, key="translate_another_edit"):
                 st.session_state.step = 1
                 st.session_state.translation_complete = False
+                st.query_params.pop('job', None)
                 st.session_state.uploaded_file = None
                 st.session_state.output_paths = None
                 st.session_state.translations = []
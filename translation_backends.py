@@ -0,0 +1,357 @@
+"""
+Translation Backends
+Common interface for translation services, the free Google Translate
+backend and a deterministic in-process stand-in for offline load tests
+"""
+
+import os
+import time
+import random
+import threading
+import requests
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+from deep_translator import GoogleTranslator
+from deep_translator.constants import BASE_URLS
+from deep_translator.exceptions import BaseError
+from resilient_client import RetryPolicy, CircuitBreaker, AdaptiveRateLimiter
+
+# Segments in a batch are joined with newlines; Google keeps line breaks intact
+BATCH_SEPARATOR = '\n'
+
+GOOGLE_TRANSLATE_URL = BASE_URLS['GOOGLE_TRANSLATE']
+REQUEST_TIMEOUT = float(os.getenv('TRANSLATION_REQUEST_TIMEOUT', 30))
+# Keep-alive connections kept open to the translation service per process
+HTTP_POOL_SIZE = int(os.getenv('TRANSLATION_HTTP_POOL_SIZE', 16))
+
+
+class BackendError(Exception):
+    """A translation request failed"""
+
+
+class BatchSplitError(BackendError):
+    """A batch response did not split back into one result per segment"""
+
+
+class ThrottledError(BackendError):
+    """The service rejected the request for exceeding its rate limit (HTTP 429)"""
+
+
+class BackendTimeoutError(BackendError):
+    """The request timed out or the connection failed"""
+
+
+class HardFailureError(BackendError):
+    """The service rejected this input; retrying the same request will not help"""
+
+
+class CircuitOpenError(BackendError):
+    """The circuit breaker is open, so the request was not sent"""
+
+
+class TranslationBackend:
+    """
+    Base class for translation backends
+
+    Subclasses implement translate(); translate_batch() sends a whole batch
+    as one newline-joined request by default.
+    """
+    name = 'base'
+    max_payload_chars = 4500
+    supported_languages = None  # None means any language code is accepted
+
+    def translate(self, text, target_lang, source_lang='auto'):
+        """Translate one text with a single request"""
+        raise NotImplementedError
+
+    def translate_batch(self, texts, target_lang, source_lang='auto'):
+        """
+        Translate several texts with a single request
+
+        Raises:
+            BatchSplitError: If the response cannot be matched back to the texts
+        """
+        joined = self.translate(BATCH_SEPARATOR.join(texts), target_lang, source_lang)
+        parts = joined.split(BATCH_SEPARATOR) if joined else []
+        if len(parts) != len(texts) or not all(p.strip() for p in parts):
+            raise BatchSplitError(f"Batch split mismatch ({len(parts)} != {len(texts)})")
+        return [p.strip() for p in parts]
+
+    def supports(self, lang):
+        """True if the backend can translate to or from lang"""
+        return lang == 'auto' or self.supported_languages is None or lang in self.supported_languages
+
+
+_http_session = None
+_google_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_session():
+    """Process-wide requests.Session with a pool of keep-alive connections"""
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
+
+
+class GoogleClient:
+    """
+    Long-lived Google Translate client for one (source, target) pair
+
+    Languages are validated once when the client is created; every request
+    then goes through the shared pooled session. Safe to use from several
+    threads at once because no per-request state is stored on the client.
+    """
+
+    def __init__(self, source_lang, target_lang, session=None):
+        try:
+            # deep_translator resolves language names to codes and validates them
+            translator = GoogleTranslator(source=source_lang, target=target_lang)
+        except BaseError as e:
+            raise HardFailureError(str(e)) from e
+        self.source = translator._source
+        self.target = translator._target
+        self.session = session or get_http_session()
+
+    def translate(self, text):
+        if len(text) >= 5000:
+            raise HardFailureError(f"Payload of {len(text)} characters exceeds Google's 5000 limit")
+        text = text.strip()
+        if not text or self.source == self.target:
+            return text
+
+        try:
+            response = self.session.get(
+                GOOGLE_TRANSLATE_URL, params={'sl': self.source, 'tl': self.target, 'q': text},
+                timeout=REQUEST_TIMEOUT,
+            )
+        except (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            raise BackendTimeoutError(str(e)) from e
+        except requests.RequestException as e:
+            # Redirect loops, undecodable bodies and the like: worth another try
+            raise BackendError(f"Google Translate request failed: {e}") from e
+        status = response.status_code
+        if status == 429:
+            raise ThrottledError("Google Translate rate limit exceeded (429)")
+        if status == 408:
+            raise BackendTimeoutError("Google Translate request timed out (408)")
+        if 400 <= status < 500:
+            # The request itself was rejected; sending it again gets the same answer
+            raise HardFailureError(f"Google Translate rejected the request with HTTP {status}")
+        if not 200 <= status < 300:
+            # Usually a temporary server error
+            raise BackendError(f"Google Translate returned HTTP {status}")
+
+        try:
+            page = html.fromstring(response.content)
+        except (etree.ParserError, ValueError) as e:
+            # Empty or truncated page, as sometimes served under load
+            raise BackendError(f"Unreadable Google Translate response: {e}") from e
+        elements = page.find_class('t0') or page.find_class('result-container')
+        if not elements:
+            raise HardFailureError(f"No translation found for: {text[:50]}")
+        return elements[0].text_content().strip()
+
+
+def get_google_client(source_lang, target_lang):
+    """Shared GoogleClient for a language pair, created on first use"""
+    key = (source_lang, target_lang)
+    client = _google_clients.get(key)
+    if client is None:
+        client = GoogleClient(source_lang, target_lang)
+        with _clients_lock:
+            client = _google_clients.setdefault(key, client)
+    return client
+
+
+class GoogleBackend(TranslationBackend):
+    """Free Google Translate (no API key required) over pooled keep-alive connections"""
+    name = 'google'
+    # Google Translate rejects payloads of 5000 characters or more
+    max_payload_chars = 4500
+
+    def translate(self, text, target_lang, source_lang='auto'):
+        return get_google_client(source_lang, target_lang).translate(text)
+
+
+class LocalBackend(TranslationBackend):
+    """
+    Deterministic in-process stand-in for a translation service
+
+    Returns '[<target>] <text>' for every line, after simulating latency,
+    a request-rate limit and random failures, so the whole pipeline can be
+    load-tested and benchmarked offline. With reject_over_limit the rate
+    limit behaves like a real service and answers excess requests with
+    ThrottledError instead of queueing them.
+    """
+    name = 'local'
+
+    def __init__(self, latency=0.05, per_char_latency=0.0, max_requests_per_second=None,
+                 error_rate=0.0, max_payload_chars=4500, seed=None, reject_over_limit=False):
+        """
+        Args:
+            latency: Seconds per request
+            per_char_latency: Extra seconds per character of payload
+            max_requests_per_second: Throughput limit shared by all threads (None for unlimited)
+            error_rate: Probability that a request raises BackendTimeoutError
+            max_payload_chars: Largest accepted payload
+            seed: Random seed for reproducible error injection
+            reject_over_limit: Raise ThrottledError for requests over the rate limit
+        """
+        self.latency = latency
+        self.per_char_latency = per_char_latency
+        self.max_requests_per_second = max_requests_per_second
+        self.error_rate = error_rate
+        self.max_payload_chars = max_payload_chars
+        self.reject_over_limit = reject_over_limit
+        self.requests = 0
+        self.characters = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _wait_for_slot(self):
+        """Block until the rate limit allows another request (or reject it)"""
+        if not self.max_requests_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.reject_over_limit and now < self._next_slot:
+                self.throttled += 1
+                raise ThrottledError("Simulated rate limit exceeded (429)")
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.max_requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+    def translate(self, text, target_lang, source_lang='auto'):
+        if len(text) > self.max_payload_chars:
+            raise HardFailureError(f"Payload of {len(text)} characters exceeds {self.max_payload_chars}")
+
+        self._wait_for_slot()
+        with self._lock:
+            self.requests += 1
+            self.characters += len(text)
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency + self.per_char_latency * len(text))
+        if fail:
+            raise BackendTimeoutError("Simulated backend failure")
+
+        return BATCH_SEPARATOR.join(f'[{target_lang}] {line}' for line in text.split(BATCH_SEPARATOR))
+
+
+class ResilientBackend(TranslationBackend):
+    """
+    Wraps a backend with retries, a circuit breaker and an adaptive rate
+
+    Throttles (429) slow the request rate down and are retried; timeouts
+    and other transient errors are retried with exponential backoff and
+    jitter and count towards the circuit breaker. Hard failures and batch
+    split mismatches are raised straight away.
+    """
+
+    def __init__(self, backend, retry=None, breaker=None, limiter=None):
+        """
+        Args:
+            backend: TranslationBackend that sends the actual requests
+            retry: RetryPolicy (default: TRANSLATION_MAX_RETRIES retries)
+            breaker: CircuitBreaker (default: open after 5 consecutive failures for 30s)
+            limiter: AdaptiveRateLimiter (default: start at TRANSLATION_RATE_LIMIT requests/s)
+        """
+        self.backend = backend
+        self.name = backend.name
+        self.max_payload_chars = backend.max_payload_chars
+        self.supported_languages = backend.supported_languages
+        self.retry = retry or RetryPolicy(max_attempts=int(os.getenv('TRANSLATION_MAX_RETRIES', 5)) + 1)
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveRateLimiter(
+            initial_rate=float(os.getenv('TRANSLATION_RATE_LIMIT', 10)))
+        self.retries = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _call(self, request, *args):
+        """Send one request, retrying transient errors"""
+        attempt = 1
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Backend '{self.name}' is unavailable (circuit open), request not sent")
+            self.limiter.acquire()
+            try:
+                result = request(*args)
+            except (BatchSplitError, HardFailureError):
+                # The service answered; the problem is the input, not the service
+                self.breaker.record_success()
+                raise
+            except ThrottledError:
+                self._count('throttles')
+                self.limiter.on_throttle()
+                error_kind = 'throttled'
+            except BackendError as e:
+                self.breaker.record_failure()
+                error_kind = f'failed ({e})'
+            else:
+                self.breaker.record_success()
+                self.limiter.on_success()
+                return result
+
+            if attempt >= self.retry.max_attempts:
+                raise BackendError(f"Backend '{self.name}' request {error_kind} after {attempt} attempts")
+            delay = self.retry.delay(attempt)
+            print(f"Request {error_kind}, retry {attempt}/{self.retry.max_attempts - 1} in {delay:.2f}s")
+            self._count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+    def translate(self, text, target_lang, source_lang='auto'):
+        return self._call(self.backend.translate, text, target_lang, source_lang)
+
+    def translate_batch(self, texts, target_lang, source_lang='auto'):
+        return self._call(self.backend.translate_batch, texts, target_lang, source_lang)
+
+    def stats(self):
+        """Retry, throttle and circuit breaker counters plus the current request rate"""
+        return {
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'circuit_state': self.breaker.state,
+            'circuit_opened': self.breaker.opened,
+            'requests_per_second': round(self.limiter.rate, 2),
+        }
+
+
+BACKENDS = {
+    'google': GoogleBackend,
+    'local': LocalBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """
+    Get a backend by name (defaults to TRANSLATION_BACKEND, then 'google')
+
+    Backends are wrapped in a ResilientBackend, so requests are retried and
+    rate limited. One instance per name is shared by every job in the
+    process, so jobs share connections and a single adaptive request rate.
+    """
+    name = name or os.getenv('TRANSLATION_BACKEND', 'google')
+    if name not in BACKENDS:
+        raise Exception(f"Unknown translation backend: {name} (choose from {', '.join(BACKENDS)})")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = ResilientBackend(BACKENDS[name]())
+        return _backends[name]
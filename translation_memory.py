@@ -0,0 +1,256 @@
+"""
+Translation Memory Cache
+Two-tier cache for translated segments: an in-process LRU in front of an
+on-disk SQLite database shared by every Flask/Streamlit worker process
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+DEFAULT_DB_PATH = os.path.join('cache', 'translation_memory.sqlite3')
+
+
+def normalize_text(text):
+    """
+    Normalize source text for use in a cache key
+
+    Applies Unicode NFC normalization and collapses runs of whitespace,
+    so segments that only differ in spacing share one cache entry.
+    """
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+
+def make_key(text, source_lang, target_lang, backend):
+    """Build the cache key for a (text, source, target, backend) tuple"""
+    raw = '\x1f'.join([normalize_text(text), source_lang, target_lang, backend])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_memory_entries=20000,
+                 max_disk_entries=1000000, ttl_seconds=90 * 24 * 3600):
+        """
+        Initialize the translation memory
+
+        Args:
+            db_path: Path to the SQLite database (None keeps the cache in memory only)
+            max_memory_entries: Size of the in-process LRU tier
+            max_disk_entries: Maximum number of rows kept in the SQLite tier
+            ttl_seconds: Entries older than this are treated as misses and evicted
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lru = OrderedDict()  # key -> (translated, created)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # sqlite3 connections are per thread
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        if self.db_path:
+            try:
+                self._init_db()
+            except sqlite3.Error as e:
+                # Fall back to memory-only caching (e.g. read-only file system)
+                print(f"Translation memory disk tier disabled: {e}")
+                self.db_path = None
+
+    def _connect(self):
+        """Return this thread's SQLite connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        """Create the database file and schema if needed"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                ' key TEXT PRIMARY KEY,'
+                ' source_text TEXT NOT NULL,'
+                ' translated_text TEXT NOT NULL,'
+                ' source_lang TEXT NOT NULL,'
+                ' target_lang TEXT NOT NULL,'
+                ' backend TEXT NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_translations_accessed ON translations (accessed)')
+
+    def _expired(self, created, now):
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def _remember(self, key, translated, created):
+        """Insert into the LRU tier, evicting the least recently used entry if full"""
+        with self._lock:
+            self._lru[key] = (translated, created)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_memory_entries:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, text, source_lang, target_lang, backend):
+        """
+        Look up a cached translation
+
+        Returns:
+            Translated text, or None on a miss
+        """
+        key = make_key(text, source_lang, target_lang, backend)
+        now = time.time()
+
+        # Tier 1: in-process LRU
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if self._expired(entry[1], now):
+                    del self._lru[key]
+                    self.evictions += 1
+                else:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+
+        # Tier 2: shared SQLite database
+        if self.db_path:
+            try:
+                conn = self._connect()
+                row = conn.execute(
+                    'SELECT translated_text, created FROM translations WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    translated, created = row
+                    if self._expired(created, now):
+                        with conn:
+                            conn.execute('DELETE FROM translations WHERE key = ?', (key,))
+                        self.evictions += 1
+                    else:
+                        with conn:
+                            conn.execute('UPDATE translations SET accessed = ? WHERE key = ?', (now, key))
+                        self._remember(key, translated, created)
+                        self.disk_hits += 1
+                        return translated
+            except sqlite3.Error as e:
+                print(f"Translation memory read failed: {e}")
+
+        self.misses += 1
+        return None
+
+    def put(self, text, translated, source_lang, target_lang, backend):
+        """Store a translation in both tiers"""
+        key = make_key(text, source_lang, target_lang, backend)
+        now = time.time()
+        self._remember(key, translated, now)
+        self.writes += 1
+
+        if not self.db_path:
+            return
+
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, normalize_text(text), translated, source_lang, target_lang, backend, now, now)
+                )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 1000:
+                self.prune()
+        except sqlite3.Error as e:
+            print(f"Translation memory write failed: {e}")
+
+    def prune(self):
+        """Evict expired rows and trim the disk tier to max_disk_entries"""
+        self._writes_since_prune = 0
+        if not self.db_path:
+            return
+        conn = self._connect()
+        with conn:
+            removed = 0
+            if self.ttl_seconds is not None:
+                cursor = conn.execute('DELETE FROM translations WHERE created < ?',
+                                      (time.time() - self.ttl_seconds,))
+                removed += cursor.rowcount
+            count = conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+            if count > self.max_disk_entries:
+                # Drop the least recently accessed rows
+                cursor = conn.execute(
+                    'DELETE FROM translations WHERE key IN ('
+                    ' SELECT key FROM translations ORDER BY accessed ASC LIMIT ?)',
+                    (count - self.max_disk_entries,)
+                )
+                removed += cursor.rowcount
+        self.evictions += removed
+
+    def clear(self):
+        """Remove every cached translation from both tiers"""
+        with self._lock:
+            self._lru.clear()
+        if self.db_path:
+            conn = self._connect()
+            with conn:
+                conn.execute('DELETE FROM translations')
+
+    def stats(self):
+        """Return hit/miss counters for reporting"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'memory_entries': len(self._lru),
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory():
+    """
+    Return the process-wide translation memory, creating it on first use
+
+    Configured through environment variables:
+        TRANSLATION_MEMORY_PATH: SQLite file (empty string disables the disk tier)
+        TRANSLATION_MEMORY_TTL_DAYS: Entry lifetime in days (default 90)
+        TRANSLATION_MEMORY_MAX_ENTRIES: Maximum rows in the disk tier
+        TRANSLATION_MEMORY_DISABLED: Set to 1 to bypass the cache entirely
+    """
+    global _memory
+    if os.getenv('TRANSLATION_MEMORY_DISABLED') == '1':
+        return None
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = TranslationMemory(
+                    db_path=os.getenv('TRANSLATION_MEMORY_PATH', DEFAULT_DB_PATH) or None,
+                    max_disk_entries=int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', 1000000)),
+                    ttl_seconds=float(os.getenv('TRANSLATION_MEMORY_TTL_DAYS', 90)) * 24 * 3600,
+                )
+    return _memory
@@ -1,354 +1,735 @@
 """
 IDML Arabic Translation Tool - Core Translation Module
 Handles IDML extraction, translation, font mapping, and reconstruction
-Using FREE Google Translate (no API key required)
+Using FREE Google Translate (no API key required) or any other translation backend
 """
 
 import os
-import zipfile
 import tempfile
-import shutil
+import threading
 from pathlib import Path
 from lxml import etree
-from simple_translator import translate_text
+from simple_translator import translate_batch
+from translation_backends import get_backend
+from idml_archive import (
+    open_idml, story_members, read_xml_member, xml_bytes, write_idml, read_story_trees,
+    member_fingerprint
+)
+from segment_manifest import (
+    segment_id, story_self_id, element_path, find_element, write_manifest, load_manifest,
+    manifest_path_for, index_segments, text_hash
+)
+from segmentation import (
+    SEGMENTATION_MODES, DEFAULT_SEGMENTATION, RUN_MARKER, can_join, join_runs, split_runs,
+    strip_markers
+)
+from segment_classifier import TRANSLATE, CONVERT_DIGITS, classify_segment, local_translation
+from font_mapper import FontMapper
+from story_stream import ElementRecord, relative_path, stream_xml
+from result_cache import get_result_cache, file_hash, make_job_key
 from word_generator import create_word_document
+from metrics import JobMetrics, REGISTRY
 
+# Number of translation requests kept in flight at once
+DEFAULT_CONCURRENCY = int(os.getenv('TRANSLATION_CONCURRENCY', 4))
+
+# Part of every result cache key; bump it whenever a change alters the
+# translated output so cached jobs from older code are not served
+PIPELINE_VERSION = 1
+
+# Story and style members of at least this many (uncompressed) bytes are
+# streamed instead of parsed into a tree; 0 streams every member
+STREAMING_THRESHOLD = int(os.getenv('TRANSLATION_STREAMING_THRESHOLD', 8 * 1024 * 1024))
+
+# Attributes applied to every ParagraphStyleRange / CharacterStyleRange per target language
+PARAGRAPH_FORMATTING = {
+    'ar': {
+        'Composer': 'Adobe World-Ready Paragraph Composer',
+        'StoryDirection': 'RightToLeftDirection',
+        'Justification': 'RightAlign',
+        'AppliedLanguage': 'Language:$ID/Arabic',
+        'DigitsType': 'DefaultDigits',
+    },
+    'en': {
+        'Composer': 'Adobe Paragraph Composer',
+        'StoryDirection': 'LeftToRightDirection',
+        'Justification': 'LeftAlign',
+        'AppliedLanguage': 'Language:$ID/English: USA',
+    },
+}
+
+CHARACTER_FORMATTING = {
+    # CRITICAL: Arabic character ranges need these for proper letter joining
+    'ar': {
+        'AppliedLanguage': 'Language:$ID/Arabic',
+        'DigitsType': 'DefaultDigits',
+        'KashidaWidth': 'Medium',
+        'KerningMethod': 'Optical',
+    },
+    'en': {
+        'AppliedLanguage': 'Language:$ID/English: USA',
+        'KerningMethod': 'Optical',
+    },
+}
 
 class IDMLTranslator:
-    def __init__(self, api_key=None, target_lang='ar'):
-        """Initialize the translator (API key not needed for free version)"""
-        self.temp_dir = None
+    def __init__(self, api_key=None, target_lang='ar', concurrency=DEFAULT_CONCURRENCY,
+                 output_dir='uploads', backend=None, segmentation=DEFAULT_SEGMENTATION,
+                 convert_digits=CONVERT_DIGITS, streaming_threshold=STREAMING_THRESHOLD,
+                 result_cache=True):
+        """
+        Initialize the translator (API key not needed for free version)
+        
+        Args:
+            target_lang: Target language code ('ar' or 'en')
+            concurrency: Translation requests kept in flight at once
+            output_dir: Folder for the translated IDML, Word and manifest files
+            backend: TranslationBackend instance or backend name
+                (defaults to TRANSLATION_BACKEND, then Google Translate)
+            segmentation: 'paragraph' to translate the Content runs of each
+                paragraph together, 'run' to translate every Content element
+                on its own (defaults to TRANSLATION_SEGMENTATION, then 'paragraph')
+            convert_digits: Convert numbers that are not sent for translation
+                to the target language's digit forms (TRANSLATION_CONVERT_DIGITS=1)
+            streaming_threshold: Size in bytes from which a story is streamed
+                one paragraph at a time instead of parsed whole
+                (defaults to TRANSLATION_STREAMING_THRESHOLD, then 8 MB)
+            result_cache: Serve identical jobs (same input bytes and settings)
+                from the result cache and store finished jobs in it
+        """
+        if segmentation not in SEGMENTATION_MODES:
+            raise Exception(f"Unknown segmentation mode: {segmentation} "
+                            f"(choose from {', '.join(SEGMENTATION_MODES)})")
+        self.archive = None  # Open ZipFile of the IDML being translated
         self.target_lang = target_lang
+        self.backend = get_backend(backend) if backend is None or isinstance(backend, str) else backend
+        self.concurrency = concurrency
+        self.segmentation = segmentation
+        self.convert_digits = convert_digits
+        self.streaming_threshold = streaming_threshold
+        self.result_cache = get_result_cache() if result_cache else None
+        self.output_dir = output_dir
         self.translation_pairs = []  # Store all translations for review
+        self.modified_members = {}  # Archive member name -> rewritten XML bytes or temporary file
+        self.story_fingerprints = {}  # Story file -> hash of its source XML
+        self.previous = None  # Earlier translation of the same document (revision mode)
+        self.metrics = JobMetrics()
+        self.font_mapper = FontMapper(target_lang)
         
-    def translate_idml(self, idml_path, progress_callback=None):
+    def translate_idml(self, idml_path, progress_callback=None, previous_output=None):
         """
         Main translation workflow
         
         Args:
             idml_path: Path to the input IDML file
             progress_callback: Optional callback function for progress updates
+            previous_output: Translated (or edited) IDML of an earlier revision
+                of the same document. Stories whose source XML is unchanged are
+                copied from it as they are, reviewer edits included, and in
+                changed stories only new or changed segments are translated.
             
         Returns:
-            Dictionary with paths to translated IDML and Word files
+            Dictionary with paths to the translated IDML file, its segment
+            manifest and the Word document, which is only written when first
+            requested through ensure_word_document()
         """
+        metrics = self.metrics
+        metrics.settings.update(target_lang=self.target_lang, backend=self.backend.name,
+                                concurrency=self.concurrency)
         try:
-            # Step 1: Extract IDML
-            if progress_callback:
-                progress_callback("Extracting IDML file...", 10)
-            self.temp_dir = tempfile.mkdtemp()
-            self._extract_idml(idml_path)
+            # Identical jobs are answered from the result cache
+            # Revision jobs depend on the previous output as well, so they bypass it
+            cache_key = None
+            if self.result_cache is not None and previous_output is None:
+                with metrics.stage('result_cache'):
+                    cache_key = self.job_key(idml_path)
+                    result = self._restore_cached_job(cache_key, idml_path)
+                if result is not None:
+                    if progress_callback:
+                        progress_callback("Translation complete! (cached result)", 100)
+                    return result
             
-            # DEBUG: Print target language
-            print(f"DEBUG: Target language is: {self.target_lang}")
+            # Step 1: Open IDML (members are read on demand, nothing is extracted)
+            if progress_callback:
+                progress_callback("Reading IDML file...", 10)
+            with metrics.stage('extract'):
+                self.archive = open_idml(idml_path)
+                metrics.add('bytes_read', os.path.getsize(idml_path))
+                if previous_output is not None:
+                    self._open_previous(previous_output)
             
             # Step 2: Apply World-Ready Composer fixes
             if progress_callback:
                 progress_callback("Applying formatting rules...", 20)
-            self._fix_styles_xml()
+            with metrics.stage('styles'):
+                self._fix_styles_xml()
             
-            # Step 3: Translate Stories
+            # Step 3: Format, map fonts and translate Stories in a single pass
             if progress_callback:
                 progress_callback("Translating text content...", 30)
-            self._translate_stories(progress_callback)
+            with metrics.stage('translate'):
+                self._translate_stories(progress_callback)
             
-            # Step 4: Map fonts
-            if progress_callback:
-                progress_callback("Mapping fonts for Arabic compatibility...", 80)
-            self._map_fonts()
-            
-            # Step 5: Reconstruct IDML
+            # Step 4: Reconstruct IDML
             if progress_callback:
                 progress_callback("Reconstructing IDML file...", 90)
-            idml_output_path = self._reconstruct_idml(idml_path)
+            with metrics.stage('reconstruct'):
+                idml_output_path = self._reconstruct_idml(idml_path)
+            with metrics.stage('manifest'):
+                manifest_path = write_manifest(idml_output_path, self.translation_pairs,
+                                               source_file=Path(idml_path).name,
+                                               target_lang=self.target_lang,
+                                               cache_key=cache_key,
+                                               stories=self.story_fingerprints)
+            # Like the translation memory, the cache never keeps untranslated fallbacks
+            degraded = metrics.counters['untranslated_segments'] or metrics.counters.get('marker_fallbacks')
+            if cache_key is not None and not degraded:
+                self.result_cache.put(cache_key, {'idml': idml_output_path, 'manifest': manifest_path})
             
-            # Step 6: Generate Word document
-            if progress_callback:
-                progress_callback("Generating Word document...", 95)
-            word_output_path = self._generate_word_document(idml_path)
+            # The Word document is built on first download (ensure_word_document)
+            for path in (idml_output_path, manifest_path):
+                metrics.add('bytes_written', os.path.getsize(path))
+            REGISTRY.record_job(metrics)
             
             if progress_callback:
                 progress_callback("Translation complete!", 100)
             
-            # Store results before any cleanup
-            result = {
+            return {
                 'idml': idml_output_path,
-                'word': word_output_path,
-                'translations': self.translation_pairs
+                'word': word_path_for(idml_output_path),
+                'manifest': manifest_path,
+                'translations': self.translation_pairs,
+                'metrics': metrics.to_dict(),
+                'cache_key': cache_key
             }
             
-            # Note: Temp directory cleanup is intentionally skipped here
-            # The files need to remain accessible for download
-            # Streamlit will handle cleanup when the session ends
-            
-            return result
-            
         except Exception as e:
-            # Cleanup temp directory on error
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                try:
-                    shutil.rmtree(self.temp_dir)
-                except:
-                    pass  # Ignore cleanup errors
+            REGISTRY.record_job(metrics, failed=True)
             
             # Provide detailed error information
             import traceback
             error_details = traceback.format_exc()
             print(f"Translation error details:\n{error_details}")
             raise Exception(f"Translation failed: {str(e)}")
-    
-    def _extract_idml(self, idml_path):
-        """Extract IDML archive to temporary directory"""
-        # Ensure file exists and is readable
-        if not os.path.exists(idml_path):
-            raise Exception(f"IDML file not found: {idml_path}")
         
-        if not os.path.isfile(idml_path):
-            raise Exception(f"Path is not a file: {idml_path}")
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+            if self.previous is not None:
+                self.previous['archive'].close()
+                self.previous = None
+            for data in self.modified_members.values():
+                if hasattr(data, 'close'):
+                    data.close()
+            self.modified_members = {}
+    
+    def job_key(self, idml_path):
+        """Result cache key: the input bytes plus every setting that changes the output"""
+        font_mapper = self.font_mapper
+        return make_job_key(file_hash(idml_path),
+                            pipeline=PIPELINE_VERSION,
+                            target_lang=self.target_lang,
+                            backend=self.backend.name,
+                            segmentation=self.segmentation,
+                            convert_digits=self.convert_digits,
+                            fonts=[font_mapper.mappings, font_mapper.default_font, font_mapper.keep_fonts])
+    
+    def _restore_cached_job(self, cache_key, idml_path):
+        """
+        Copy a cached job's outputs to this job's output paths
         
-        # Check if file is accessible
-        try:
-            with open(idml_path, 'rb') as test_file:
-                test_file.read(4)  # Read first 4 bytes to test
-        except Exception as e:
-            raise Exception(f"Cannot read IDML file: {str(e)}")
+        Returns:
+            translate_idml() result, or None if the job is not cached
+        """
+        idml_output_path = str(self.output_paths_for(idml_path)['idml'])
+        restored = self.result_cache.get(cache_key, {
+            'idml': idml_output_path,
+            'manifest': manifest_path_for(idml_output_path),
+            'word': word_path_for(idml_output_path),
+        })
+        if restored is None:
+            return None
         
-        # Extract the IDML archive
-        try:
-            with zipfile.ZipFile(idml_path, 'r') as zip_ref:
-                zip_ref.extractall(self.temp_dir)
-        except zipfile.BadZipFile:
-            raise Exception("Invalid IDML file: Not a valid ZIP archive")
-        except Exception as e:
-            raise Exception(f"Failed to extract IDML: {str(e)}")
+        self.translation_pairs = load_manifest(idml_output_path)['segments']
+        self.metrics.add('result_cache_hits')
+        self.metrics.add('bytes_read', os.path.getsize(idml_path))
+        self.metrics.add('segments', len(self.translation_pairs))
+        self.metrics.add('skipped_segments', sum(1 for pair in self.translation_pairs if 'skipped' in pair))
+        REGISTRY.record_job(self.metrics)
+        return {
+            'idml': idml_output_path,
+            'word': word_path_for(idml_output_path),
+            'manifest': restored['manifest'],
+            'translations': self.translation_pairs,
+            'metrics': self.metrics.to_dict(),
+            'cache_key': cache_key
+        }
+    
+    def _open_previous(self, previous_output):
+        """Load the output and segment manifest of an earlier revision"""
+        manifest = load_manifest(str(previous_output))
+        if manifest is None:
+            raise Exception(f"No segment manifest found for {previous_output}")
+        if manifest.get('target_lang') not in (None, self.target_lang):
+            raise Exception(f"{previous_output} was translated to {manifest['target_lang']}, "
+                            f"not {self.target_lang}")
+        if not manifest.get('stories'):
+            # Written before story fingerprints existed: only segments can be reused
+            self.metrics.add('previous_without_fingerprints')
         
-        # Validate structure
-        stories_dir = os.path.join(self.temp_dir, 'Stories')
-        resources_dir = os.path.join(self.temp_dir, 'Resources')
+        pairs_by_story = {}
+        for pair in manifest['segments']:
+            pairs_by_story.setdefault(pair.get('story_file'), []).append(pair)
+        self.previous = {
+            'archive': open_idml(previous_output),
+            'stories': manifest.get('stories') or {},
+            'pairs': pairs_by_story,
+            'segments': index_segments(manifest['segments']),
+        }
+    
+    def _previous_story_pairs(self, story_file, member_name, fingerprint):
+        """Translation pairs of a story that is unchanged since the previous revision, else None"""
+        previous = self.previous
+        if (previous is None or previous['stories'].get(story_file) != fingerprint
+                or member_name not in previous['archive'].NameToInfo):
+            return None
+        return previous['pairs'].get(story_file, [])
+    
+    def _read_xml(self, member_name):
+        """Parse an archive member into an lxml tree"""
+        return read_xml_member(self.archive, member_name)
+    
+    def _store_xml(self, member_name, tree):
+        """Serialize a modified tree as the replacement for an archive member"""
+        self.modified_members[member_name] = xml_bytes(tree)
+    
+    def _should_stream(self, member_name):
+        """True if a member is large enough to be streamed rather than parsed whole"""
+        return self.archive.getinfo(member_name).file_size >= self.streaming_threshold
+    
+    def _stream_member(self, member_name, process_granule, output=None):
+        """
+        Stream one archive member through process_granule (see story_stream)
         
-        if not os.path.exists(stories_dir):
-            raise Exception("Invalid IDML: Stories folder not found")
-        if not os.path.exists(resources_dir):
-            raise Exception("Invalid IDML: Resources folder not found")
+        Container elements such as <Story> only get their fonts mapped.
+        """
+        with self.archive.open(member_name) as source:
+            return stream_xml(source, process_granule, self._map_container_font, output)
+    
+    def _map_container_font(self, elem, position):
+        current_font = elem.get('AppliedFont')
+        if current_font is not None:
+            elem.set('AppliedFont', self.font_mapper.map(current_font))
     
     def _fix_styles_xml(self):
-        """Apply World-Ready Composer and RTL alignment to paragraph styles"""
-        styles_path = os.path.join(self.temp_dir, 'Resources', 'Styles.xml')
-        
-        if not os.path.exists(styles_path):
-            return  # No styles to fix
+        """
+        Apply World-Ready Composer and RTL alignment to paragraph styles and
+        map the fonts of Styles.xml and Fonts.xml
+        """
+        styles_member = 'Resources/Styles.xml'
         
-        # Parse XML
-        parser = etree.XMLParser(remove_blank_text=False)
-        tree = etree.parse(styles_path, parser)
-        root = tree.getroot()
+        if styles_member in self.archive.NameToInfo and self._should_stream(styles_member):
+            output = tempfile.TemporaryFile()
+            self.modified_members[styles_member] = output
+            self._stream_member(styles_member, lambda elem, position: self._process_styles(elem),
+                                output)
+        elif styles_member in self.archive.NameToInfo:
+            # Parse XML
+            tree = self._read_xml(styles_member)
+            self._process_styles(tree.getroot())
+            
+            # Store the rewritten member
+            self._store_xml(styles_member, tree)
         
-        # Apply language-specific formatting to styles
+        self._map_font_families()
+    
+    def _process_styles(self, root):
+        """Apply language-specific style fixes and font mapping in one traversal"""
         if self.target_lang == 'ar':
             # Arabic-specific style fixes
-            for para_style in root.iter('ParagraphStyle'):
-                para_style.set('Composer', 'Adobe World-Ready Paragraph Composer')
-                
-                # Set right alignment for RTL
-                current_justification = para_style.get('Justification', '')
-                if 'Center' not in current_justification:
-                    para_style.set('Justification', 'RightAlign')
-                
-                para_style.set('AppliedLanguage', 'Language:$ID/Arabic')
-                para_style.set('DigitsType', 'DefaultDigits')
-            
-            # CRITICAL: Also fix CharacterStyle elements for proper letter joining
-            for char_style in root.iter('CharacterStyle'):
-                char_style.set('AppliedLanguage', 'Language:$ID/Arabic')
-                char_style.set('KerningMethod', 'Optical')
-        
+            composer = 'Adobe World-Ready Paragraph Composer'
+            alignment = 'RightAlign'  # Set right alignment for RTL
+            language = 'Language:$ID/Arabic'
         elif self.target_lang == 'en':
             # English-specific style fixes
-            for para_style in root.iter('ParagraphStyle'):
-                para_style.set('Composer', 'Adobe Paragraph Composer')
+            composer = 'Adobe Paragraph Composer'
+            alignment = 'LeftAlign'  # Set left alignment for LTR
+            language = 'Language:$ID/English: USA'
+        else:
+            composer = None
+        
+        for elem in root.iter(etree.Element):
+            tag = elem.tag
+            if composer and tag == 'ParagraphStyle':
+                elem.set('Composer', composer)
                 
-                # Set left alignment for LTR
-                current_justification = para_style.get('Justification', '')
+                current_justification = elem.get('Justification', '')
                 if 'Center' not in current_justification:
-                    para_style.set('Justification', 'LeftAlign')
+                    elem.set('Justification', alignment)
                 
-                para_style.set('AppliedLanguage', 'Language:$ID/English: USA')
+                elem.set('AppliedLanguage', language)
+                if self.target_lang == 'ar':
+                    elem.set('DigitsType', 'DefaultDigits')
+            
+            elif composer and tag == 'CharacterStyle':
+                # CRITICAL: CharacterStyle elements need these for proper letter joining
+                elem.set('AppliedLanguage', language)
+                elem.set('KerningMethod', 'Optical')
             
-            # Fix CharacterStyle elements
-            for char_style in root.iter('CharacterStyle'):
-                char_style.set('AppliedLanguage', 'Language:$ID/English: USA')
-                char_style.set('KerningMethod', 'Optical')
+            elif tag == 'AppliedFont' and elem.text:
+                # <Properties><AppliedFont type="string">Minion Pro</AppliedFont>
+                elem.text = self.font_mapper.map(elem.text)
+            
+            current_font = elem.get('AppliedFont')
+            if current_font is not None:
+                elem.set('AppliedFont', self.font_mapper.map(current_font))
+    
+    def _map_font_families(self):
+        """
+        Rename the font families in Fonts.xml that the font table maps
+        
+        A family is left alone if the document already has a family with
+        the mapped name, so Fonts.xml never lists the same family twice.
+        """
+        fonts_member = 'Resources/Fonts.xml'
+        if fonts_member not in self.archive.NameToInfo:
+            return
         
-        # Write back to file
-        tree.write(styles_path, encoding='UTF-8', xml_declaration=True, pretty_print=False)
+        tree = self._read_xml(fonts_member)
+        families = tree.getroot().findall('FontFamily')
+        names = {family.get('Name') for family in families}
+        changed = False
+        for family in families:
+            name = family.get('Name')
+            mapped = self.font_mapper.map_family(name) if name else name
+            if mapped == name or mapped in names:
+                continue
+            
+            names.add(mapped)
+            family.set('Name', mapped)
+            for font in family.iter('Font'):
+                if font.get('FontFamily') == name:
+                    font.set('FontFamily', mapped)
+            changed = True
+        
+        # Only rewrite Fonts.xml if a family was renamed
+        if changed:
+            self._store_xml(fonts_member, tree)
     
     def _translate_stories(self, progress_callback=None):
-        """Translate all text in Stories XML files"""
-        stories_dir = os.path.join(self.temp_dir, 'Stories')
-        story_files = [f for f in os.listdir(stories_dir) if f.endswith('.xml')]
+        """
+        Format, font-map and translate all Stories XML files
         
-        total_stories = len(story_files)
+        Each story is parsed once. A single traversal applies paragraph and
+        character formatting, maps fonts and collects segments; segments that
+        need no translation are resolved locally and the rest of the
+        deduplicated segment set is translated in size-bounded batches
+        and the results are written back to every occurrence.
         
-        for idx, story_file in enumerate(story_files):
-            story_path = os.path.join(stories_dir, story_file)
-            
-            # Update progress
-            if progress_callback:
-                progress = 30 + int((idx / total_stories) * 50)
-                progress_callback(f"Translating story {idx + 1}/{total_stories}...", progress)
-            
-            # Parse XML
-            parser = etree.XMLParser(remove_blank_text=False)
-            tree = etree.parse(story_path, parser)
-            root = tree.getroot()
+        Stories of streaming_threshold bytes or more are never held as a
+        tree: they are scanned once for their segments and streamed a second
+        time, one top-level paragraph at a time, to write the translations.
+        
+        When a previous revision is loaded, unchanged stories are copied
+        from its output and unchanged segments keep their earlier translation.
+        """
+        # Phase 1: parse each story once, format it and collect segments
+        stories = []  # (story_file, member_name, tree or None, story_id, [(element_index, [runs])])
+        reused_stories = {}  # member name -> translation pairs of an unchanged story
+        for member_name in story_members(self.archive):
+            story_file = member_name.split('/', 1)[1]
+            fingerprint = self.story_fingerprints[story_file] = member_fingerprint(self.archive, member_name)
             
-            # Apply language-specific formatting based on target language
-            if self.target_lang == 'ar':
-                # Arabic-specific formatting
-                for para_range in root.iter('ParagraphStyleRange'):
-                    para_range.set('Composer', 'Adobe World-Ready Paragraph Composer')
-                    para_range.set('StoryDirection', 'RightToLeftDirection')
-                    para_range.set('Justification', 'RightAlign')
-                    para_range.set('AppliedLanguage', 'Language:$ID/Arabic')
-                    para_range.set('DigitsType', 'DefaultDigits')
-                
-                # CRITICAL: Also apply to CharacterStyleRange for proper letter joining
-                for char_range in root.iter('CharacterStyleRange'):
-                    char_range.set('AppliedLanguage', 'Language:$ID/Arabic')
-                    char_range.set('DigitsType', 'DefaultDigits')
-                    char_range.set('KashidaWidth', 'Medium')
-                    char_range.set('KerningMethod', 'Optical')
+            previous_pairs = self._previous_story_pairs(story_file, member_name, fingerprint)
+            if previous_pairs is not None:
+                reused_stories[member_name] = previous_pairs
+                tree, story_id, segments = None, None, []
+            elif self._should_stream(member_name):
+                tree = None
+                story_id, segments = self._scan_story(member_name)
+            else:
+                # Parse XML
+                tree = self._read_xml(member_name)
+                story_id = story_self_id(tree.getroot())
+                segments, _ = self._process_story(tree.getroot())
+            stories.append((story_file, member_name, tree, story_id, segments))
+        
+        # Segments of changed stories whose source text is the same as in the
+        # previous revision keep their previous (possibly edited) translation
+        reused = {}  # (member name, element_index) -> previous translation pair
+        if self.previous is not None:
+            for _, member_name, tree, story_id, segments in stories:
+                for idx, runs in segments:
+                    prior = self.previous['segments'].get(segment_id(story_id, self._run_path(tree, runs[0])))
+                    if prior is not None and prior.get('source_hash') == text_hash(
+                            ''.join(content.text for content in runs)):
+                        reused[(member_name, idx)] = prior
+        
+        # Phase 2: translate each distinct segment once, largest stories first
+        # so the longest-running work starts as early as possible
+        by_size = sorted(stories, key=lambda story: len(story[4]), reverse=True)
+        unique_texts = list(dict.fromkeys(
+            self._source_text(runs) for story in by_size for idx, runs in story[4]
+            if (story[1], idx) not in reused
+        ))
+        
+        def batch_progress(done, total):
+            if progress_callback and total:
+                progress = 30 + int((done / total) * 50)
+                progress_callback(f"Translating segment {done}/{total}...", progress)
+        
+        self.metrics.add('segments', sum(len(story[4]) for story in stories))
+        self.metrics.add('unique_segments', len(unique_texts))
+        self.metrics.add('characters', sum(
+            len(content.text) for story in stories for _, runs in story[4] for content in runs
+        ))
+        self.metrics.add('unique_characters', sum(len(text) for text in unique_texts))
+        
+        # Numbers, codes, URLs and text already in the target script are
+        # handled locally instead of being sent to the backend
+        skipped = {}  # source text -> reason
+        to_translate = []
+        for text in unique_texts:
+            kind = classify_segment(text, self.target_lang)
+            if kind == TRANSLATE:
+                to_translate.append(text)
+            else:
+                skipped[text] = kind
+        
+        translated_texts = self._translate_batch(to_translate, batch_progress)
+        translations = dict(zip(to_translate, translated_texts))
+        for text, kind in skipped.items():
+            translations[text] = local_translation(text, kind, self.target_lang, self.convert_digits)
+        
+        # Phase 3: write translations back to every occurrence, in document
+        # order so translation pair IDs stay deterministic
+        for story_file, member_name, tree, story_id, segments in stories:
+            if member_name in reused_stories:
+                # Unchanged story: copied verbatim from the previous output
+                for prior in reused_stories[member_name]:
+                    self.translation_pairs.append(dict(prior, id=len(self.translation_pairs) + 1))
+                self.modified_members[member_name] = (self.previous['archive'], member_name)
+                self.metrics.add('reused_stories')
+                self.metrics.add('reused_segments', len(reused_stories[member_name]))
+                continue
             
-            elif self.target_lang == 'en':
-                # English-specific formatting
-                for para_range in root.iter('ParagraphStyleRange'):
-                    para_range.set('Composer', 'Adobe Paragraph Composer')
-                    para_range.set('StoryDirection', 'LeftToRightDirection')
-                    para_range.set('Justification', 'LeftAlign')
-                    para_range.set('AppliedLanguage', 'Language:$ID/English: USA')
+            for idx, runs in segments:
+                original_texts = [content.text for content in runs]
+                prior = reused.get((member_name, idx))
+                if prior is not None:
+                    skip_reason = prior.get('skipped')
+                    parts = self._previous_parts(prior, len(runs))
+                    self.metrics.add('reused_segments')
+                else:
+                    source_text = self._source_text(runs)
+                    translated = translations[source_text]
+                    skip_reason = skipped.get(source_text)
+                    parts = split_runs(translated, original_texts)
+                    if parts is None:
+                        # Run markers got lost: keep the whole paragraph in its first run
+                        self.metrics.add('marker_fallbacks')
+                        parts = [strip_markers(translated)] + [''] * (len(runs) - 1)
+                if skip_reason:
+                    self.metrics.add('skipped_segments')
+                    self.metrics.add(f'skipped_{skip_reason}')
+                for content, part in zip(runs, parts):
+                    content.text = part
+                path = self._run_path(tree, runs[0])
                 
-                # Set English language on character ranges
-                for char_range in root.iter('CharacterStyleRange'):
-                    char_range.set('AppliedLanguage', 'Language:$ID/English: USA')
-                    char_range.set('KerningMethod', 'Optical')
+                # Store translation pair for review
+                pair = {
+                    'id': len(self.translation_pairs) + 1,
+                    'segment_id': segment_id(story_id, path),
+                    'original': ''.join(original_texts),
+                    'translated': ''.join(parts),
+                    'story_file': story_file,
+                    'story_id': story_id,
+                    'path': path,
+                    'element_index': idx
+                }
+                if skip_reason:
+                    pair['skipped'] = skip_reason
+                if len(runs) > 1:
+                    pair['run_paths'] = [self._run_path(tree, content) for content in runs]
+                    pair['translated_runs'] = parts
+                self.translation_pairs.append(pair)
             
-            # Extract and translate Content tags
-            for idx, content in enumerate(root.iter('Content')):
-                if content.text and content.text.strip():
-                    original_text = content.text
-                    translated_text = self._translate_text(original_text)
-                    content.text = translated_text
-                    
-                    # Store translation pair for review
-                    self.translation_pairs.append({
-                        'id': len(self.translation_pairs) + 1,
-                        'original': original_text,
-                        'translated': translated_text,
-                        'story_file': story_file,
-                        'element_index': idx
-                    })
-            
-            # Write back to file
-            tree.write(story_path, encoding='UTF-8', xml_declaration=True, pretty_print=False)
-    
-    def _translate_text(self, text):
-        """Translate text using free Google Translate"""
-        print(f"DEBUG: Translating to {self.target_lang}: {text[:50]}...")
-        result = translate_text(text, target_lang=self.target_lang, source_lang='auto')
-        print(f"DEBUG: Result: {result[:50]}...")
-        return result
-    
-    def _map_fonts(self):
-        """Map English fonts to Arabic-compatible fonts"""
-        stories_dir = os.path.join(self.temp_dir, 'Stories')
-        story_files = [f for f in os.listdir(stories_dir) if f.endswith('.xml')]
-        
-        # Comprehensive font mapping dictionary - map common fonts to Arabic-compatible ones
-        font_map = {
-            'Minion Pro': 'Adobe Arabic',
-            'Myriad Pro': 'Adobe Arabic',
-            'Times New Roman': 'Arial',
-            'Times': 'Arial',
-            'Helvetica': 'Arial',
-            'Helvetica Neue': 'Arial',
-            'Calibri': 'Arial',
-            'Verdana': 'Arial',
-            'Georgia': 'Arial',
-            'Garamond': 'Adobe Arabic',
-            'Palatino': 'Adobe Arabic',
-            'Baskerville': 'Adobe Arabic',
-            'Futura': 'Arial',
-            'Avenir': 'Arial',
-        }
+            # Store the rewritten member
+            if tree is None:
+                self._rewrite_streamed_story(member_name, segments)
+            else:
+                self._store_xml(member_name, tree)
+    
+    def _scan_story(self, member_name):
+        """
+        First pass over a streamed story: collect its segments
         
-        for story_file in story_files:
-            story_path = os.path.join(stories_dir, story_file)
-            
-            # Parse XML
-            parser = etree.XMLParser(remove_blank_text=False)
-            tree = etree.parse(story_path, parser)
-            root = tree.getroot()
-            
-            # Find and update font references
-            for elem in root.iter():
-                if 'AppliedFont' in elem.attrib:
-                    current_font = elem.get('AppliedFont')
-                    
-                    # Check if font needs mapping
-                    font_replaced = False
-                    for old_font, new_font in font_map.items():
-                        if old_font in current_font:
-                            elem.set('AppliedFont', current_font.replace(old_font, new_font))
-                            font_replaced = True
-                            break
-                    
-                    # If no specific mapping found, default to Arial for safety
-                    # This ensures ALL text uses an Arabic-compatible font
-                    if not font_replaced and 'Adobe Arabic' not in current_font and 'Arial' not in current_font:
-                        # Extract font style (Regular, Bold, Italic, etc.) if present
-                        if '\t' in current_font:
-                            parts = current_font.split('\t')
-                            elem.set('AppliedFont', f"Arial\t{parts[1] if len(parts) > 1 else 'Regular'}")
-                        else:
-                            elem.set('AppliedFont', 'Arial')
-            
-            # Write back to file
-            tree.write(story_path, encoding='UTF-8', xml_declaration=True, pretty_print=False)
+        Returns:
+            (Self ID of the story, [(element_index, [ElementRecord])]), the
+            records standing in for the Content elements of a parsed tree
+        """
+        story_ids = []
+        segments = []
+        content_index = 0
+        
+        def scan_container(elem, position):
+            if elem.tag == 'Story' and not story_ids:
+                story_ids.append(elem.get('Self', ''))
+        
+        def scan_paragraph(elem, position):
+            nonlocal content_index
+            found, content_index = self._process_story(elem, content_index)
+            for idx, runs in found:
+                segments.append((idx, [
+                    ElementRecord(content.text, position, relative_path(elem, content))
+                    for content in runs
+                ]))
+        
+        with self.archive.open(member_name) as source:
+            stream_xml(source, scan_paragraph, scan_container)
+        return (story_ids[0] if story_ids else ''), segments
     
-    def _reconstruct_idml(self, original_path):
-        """Zip the modified directory back into IDML format"""
-        # Generate output filename in uploads folder
-        original_name = Path(original_path).stem
-        # Save to uploads folder to ensure it persists
-        uploads_dir = Path('uploads')
-        uploads_dir.mkdir(exist_ok=True)
-        output_path = uploads_dir / f"{original_name}_AR.idml"
-        
-        # Create zip archive
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(self.temp_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, self.temp_dir)
-                    zipf.write(file_path, arcname)
-        
-        # Don't clean up temp directory yet - Word generator needs it
-        # Cleanup will happen in translate_idml() after Word generation
+    def _rewrite_streamed_story(self, member_name, segments):
+        """
+        Second pass over a streamed story: format it again and write the
+        translated texts held by its ElementRecords to a temporary file
+        """
+        remaining = iter(segments)
         
-        return str(output_path)
+        def rewrite_paragraph(elem, position):
+            found, _ = self._process_story(elem)
+            for _, runs in found:
+                _, records = next(remaining, (None, None))
+                if records is None or len(records) != len(runs):
+                    raise Exception(f"{member_name} changed while it was being translated")
+                for content, record in zip(runs, records):
+                    content.text = record.text
+        
+        output = tempfile.TemporaryFile()
+        self.modified_members[member_name] = output
+        self._stream_member(member_name, rewrite_paragraph, output)
     
-    def _generate_word_document(self, original_path):
-        """Generate Word document from translated content"""
-        # Generate output filename
+    @staticmethod
+    def _previous_parts(pair, run_count):
+        """Run texts for a segment that keeps its translation from a previous revision"""
+        translated_runs = pair.get('translated_runs')
+        if (translated_runs and len(translated_runs) == run_count
+                and ''.join(translated_runs) == pair['translated']):
+            return list(translated_runs)
+        # Edited since, or split into runs differently: the whole text goes
+        # into the first run, as apply_edits_to_idml does
+        return [pair['translated']] + [''] * (run_count - 1)
+    
+    @staticmethod
+    def _run_path(tree, content):
+        """Manifest path of a Content element or of the ElementRecord of a streamed story"""
+        return content.path if tree is None else element_path(tree, content)
+    
+    def _process_story(self, root, content_index=0):
+        """
+        Apply formatting and font mapping to a story in one traversal
+        
+        In paragraph mode the non-blank Content runs of each paragraph (a
+        ParagraphStyleRange, split at Br) form one segment; Content inside a
+        nested ParagraphStyleRange, such as a table cell, belongs to that
+        range. In run mode every non-blank Content is its own segment. A
+        paragraph that would exceed the backend's payload limit once joined
+        continues in a new segment.
+        
+        Args:
+            root: Story root, or one top-level paragraph of a streamed story
+            content_index: Index of the first Content element under root
+        
+        Returns:
+            (list of (element_index of the first run, [Content elements]) in
+            document order, index following the last Content element)
+        """
+        para_formatting = PARAGRAPH_FORMATTING.get(self.target_lang, {})
+        char_formatting = CHARACTER_FORMATTING.get(self.target_lang, {})
+        by_paragraph = self.segmentation == 'paragraph'
+        segments = []
+        open_paragraphs = {}  # owning ParagraphStyleRange -> segment being filled
+        open_chars = {}  # owning ParagraphStyleRange -> joined length of its open segment
+        max_chars = self.backend.max_payload_chars
+        
+        for elem in root.iter(etree.Element):
+            tag = elem.tag
+            if tag == 'ParagraphStyleRange':
+                for name, value in para_formatting.items():
+                    elem.set(name, value)
+            elif tag == 'CharacterStyleRange':
+                for name, value in char_formatting.items():
+                    elem.set(name, value)
+            elif tag == 'Content':
+                if elem.text and elem.text.strip():
+                    # Runs that would clash with the markers are translated on their own
+                    if by_paragraph and can_join(elem.text):
+                        owner = next(elem.iterancestors('ParagraphStyleRange'), None)
+                        segment = open_paragraphs.get(owner)
+                        if segment is not None:
+                            joined_chars = (open_chars[owner] + len(elem.text)
+                                            + len(RUN_MARKER.format(len(segment[1]))))
+                            if joined_chars > max_chars:
+                                # Too long for one request: this run starts a new segment
+                                segment = None
+                        if segment is None:
+                            # Appended now so segments stay in document order
+                            segment = open_paragraphs[owner] = (content_index, [])
+                            segments.append(segment)
+                            joined_chars = len(elem.text)
+                        segment[1].append(elem)
+                        open_chars[owner] = joined_chars
+                    else:
+                        segments.append((content_index, [elem]))
+                content_index += 1
+            elif tag == 'Br' and by_paragraph:
+                open_paragraphs.pop(next(elem.iterancestors('ParagraphStyleRange'), None), None)
+            
+            current_font = elem.get('AppliedFont')
+            if current_font is not None:
+                elem.set('AppliedFont', self.font_mapper.map(current_font))
+        
+        return segments, content_index
+    
+    @staticmethod
+    def _source_text(runs):
+        """Text sent for translation: the run texts joined with run markers"""
+        return join_runs([content.text for content in runs])
+    
+    def _translate_batch(self, texts, progress_callback=None):
+        """Translate a list of unique texts with the configured backend"""
+        return translate_batch(texts, target_lang=self.target_lang, source_lang='auto',
+                               progress_callback=progress_callback,
+                               max_workers=self.concurrency,
+                               metrics=self.metrics,
+                               backend=self.backend)
+    
+    def output_paths_for(self, original_path):
+        """
+        Output file paths for a source IDML file
+        
+        Creates the output folder (uploads by default) if needed.
+        """
         original_name = Path(original_path).stem
-        uploads_dir = Path('uploads')
-        uploads_dir.mkdir(exist_ok=True)
-        word_output_path = uploads_dir / f"{original_name}_AR.docx"
+        output_dir = Path(self.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return {
+            'idml': output_dir / f"{original_name}_AR.idml",
+            'word': output_dir / f"{original_name}_AR.docx",
+        }
+    
+    def _reconstruct_idml(self, original_path):
+        """Write the output IDML, copying unmodified members without recompressing"""
+        output_path = self.output_paths_for(original_path)['idml']
         
-        # Create Word document from translated IDML content
-        create_word_document(self.temp_dir, str(word_output_path))
+        # Written beside the target and swapped in, since the previous
+        # revision being copied from may be the file being replaced
+        temp_path = f"{output_path}.tmp"
+        write_idml(self.archive, temp_path, self.modified_members)
+        os.replace(temp_path, output_path)
         
-        return str(word_output_path)
+        return str(output_path)
     
     def apply_translation_edits(self, edited_translations, output_idml_path):
         """
@@ -364,56 +745,170 @@ class IDMLTranslator:
         # Create a mapping of translation IDs to edited text
         edits_map = {t['id']: t['translated'] for t in edited_translations}
         
-        # Extract the IDML
-        temp_edit_dir = tempfile.mkdtemp()
-        with zipfile.ZipFile(output_idml_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_edit_dir)
-        
-        # Apply edits to each story file
-        stories_dir = os.path.join(temp_edit_dir, 'Stories')
+        return apply_edits_to_idml(output_idml_path, self.translation_pairs, edits_map)
+
+
+def apply_edits_to_idml(idml_path, translation_pairs, edits_map):
+    """
+    Write a copy of an IDML file with edited translations applied
+    
+    Edits are grouped by story so each affected story is parsed and
+    serialized once; every other member is copied without recompression.
+    Segments are located by their manifest path, falling back to the
+    Content element index for pairs without one. Edited paragraph segments
+    are written to their first run and the other runs are emptied. An updated segment
+    manifest is written next to the edited file.
+    
+    Args:
+        idml_path: Path to the translated IDML file
+        translation_pairs: Translation pairs with 'id', 'story_file' and
+            'path' or 'element_index' (None loads them from the job's manifest)
+        edits_map: Dict of translation ID -> new text
+    
+    Returns:
+        Path to the edited IDML file
+    """
+    manifest = None
+    if translation_pairs is None:
+        manifest = load_manifest(idml_path)
+        if manifest is None:
+            raise Exception(f"No segment manifest found for {idml_path}")
+        translation_pairs = manifest['segments']
+    
+    # Group edits by story file
+    edits_by_story = {}
+    for translation in translation_pairs:
+        if translation['id'] in edits_map and 'story_file' in translation:
+            edits_by_story.setdefault(translation['story_file'], []).append(
+                (translation, edits_map[translation['id']])
+            )
+    
+    # Convert to string and ensure proper path handling
+    output_path_str = str(idml_path)
+    if output_path_str.endswith('.idml'):
+        edited_idml_path = output_path_str[:-len('.idml')] + '_edited.idml'
+    else:
+        edited_idml_path = output_path_str + '_edited.idml'
+    
+    with open_idml(idml_path) as archive:
+        replacements = {}
         
-        for translation in self.translation_pairs:
-            trans_id = translation['id']
-            
-            # Skip if this translation wasn't edited
-            if trans_id not in edits_map:
+        for story_file, edits in edits_by_story.items():
+            member_name = f"Stories/{story_file}"
+            if member_name not in archive.NameToInfo:
                 continue
             
-            story_file = translation['story_file']
-            element_idx = translation['element_index']
-            new_text = edits_map[trans_id]
+            tree = read_xml_member(archive, member_name)
+            contents = None
             
-            # Parse the story file
-            story_path = os.path.join(stories_dir, story_file)
-            parser = etree.XMLParser(remove_blank_text=False)
-            tree = etree.parse(story_path, parser)
-            root = tree.getroot()
-            
-            # Find and update the specific Content element
-            for idx, content in enumerate(root.iter('Content')):
-                if idx == element_idx and content.text:
+            changed = False
+            for translation, new_text in edits:
+                if translation.get('path'):
+                    content = find_element(tree, translation['path'])
+                else:
+                    # Older pairs only know the Content element index
+                    if contents is None:
+                        contents = list(tree.getroot().iter('Content'))
+                    element_idx = translation['element_index']
+                    content = contents[element_idx] if element_idx < len(contents) else None
+                
+                # A paragraph segment's edited text goes into its first run
+                other_runs = [
+                    find_element(tree, path) for path in translation.get('run_paths', [])[1:]
+                ]
+                if content is None or content.text is None:
+                    continue
+                
+                # Unedited segments keep their runs (and their character formatting)
+                current_text = content.text + ''.join(run.text or '' for run in other_runs if run is not None)
+                if current_text != new_text:
                     content.text = new_text
-                    break
+                    for run in other_runs:
+                        if run is not None:
+                            run.text = ''
+                    changed = True
             
-            # Write back
-            tree.write(story_path, encoding='UTF-8', xml_declaration=True, pretty_print=False)
-        
-        # Reconstruct the IDML
-        # Convert to string and ensure proper path handling
-        output_path_str = str(output_idml_path)
-        if output_path_str.endswith('.idml'):
-            edited_idml_path = output_path_str.replace('.idml', '_edited.idml')
-        else:
-            edited_idml_path = output_path_str + '_edited.idml'
+            # Only rewrite stories that actually changed
+            if changed:
+                replacements[member_name] = xml_bytes(tree)
         
-        with zipfile.ZipFile(edited_idml_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root_dir, dirs, files in os.walk(temp_edit_dir):
-                for file in files:
-                    file_path = os.path.join(root_dir, file)
-                    arcname = os.path.relpath(file_path, temp_edit_dir)
-                    zipf.write(file_path, arcname)
-        
-        # Clean up
-        shutil.rmtree(temp_edit_dir)
-        
-        return edited_idml_path
+        write_idml(archive, edited_idml_path, replacements)
+    
+    # Keep the manifest in step with the edited file
+    if manifest is None:
+        manifest = load_manifest(idml_path) or {}
+    edited_pairs = [
+        dict(t, translated=edits_map[t['id']]) if t['id'] in edits_map else t
+        for t in translation_pairs
+    ]
+    write_manifest(edited_idml_path, edited_pairs,
+                   source_file=manifest.get('source_file'),
+                   target_lang=manifest.get('target_lang'),
+                   stories=manifest.get('stories'))
+    
+    return edited_idml_path
+
+
+_word_locks = {}
+_word_locks_guard = threading.Lock()
+
+
+def word_path_for(idml_path):
+    """Word document path for a translated IDML file (same name, .docx)"""
+    return str(Path(idml_path).with_suffix('.docx'))
+
+
+def word_document_is_current(idml_path, word_path=None):
+    """True if the Word document exists and is newer than the IDML file and its manifest"""
+    word_path = word_path or word_path_for(idml_path)
+    if not os.path.exists(word_path):
+        return False
+    built = os.path.getmtime(word_path)
+    sources = [idml_path, manifest_path_for(str(idml_path))]
+    return all(built >= os.path.getmtime(path) for path in sources if os.path.exists(path))
+
+
+def ensure_word_document(idml_path, word_path=None, segments=None, cache_key=None):
+    """
+    Build the Word document for a translated IDML file on first request
+    
+    The document is reused until the translations change, i.e. until the
+    IDML file or its segment manifest is rewritten. Concurrent requests for
+    the same document wait for a single build. Text comes from the given
+    segments or the segment manifest; the story XML is only parsed for
+    files without a manifest. A document built for a cached job is added
+    to its result cache entry.
+    
+    Args:
+        idml_path: Path to the translated (or edited) IDML file
+        word_path: Output path (defaults to the IDML path with .docx)
+        segments: Translation pairs of the job, if still in memory
+        cache_key: Result cache key of the job (read from the manifest
+            when segments are not given)
+    
+    Returns:
+        Path to the Word document
+    """
+    word_path = str(word_path or word_path_for(idml_path))
+    with _word_locks_guard:
+        lock = _word_locks.setdefault(word_path, threading.Lock())
+    
+    with lock:
+        if not word_document_is_current(idml_path, word_path):
+            if segments is None:
+                manifest = load_manifest(str(idml_path)) or {}
+                segments = manifest.get('segments')
+                cache_key = cache_key or manifest.get('cache_key')
+            
+            # Build next to the target and swap it in, so readers never see a partial file
+            temp_path = word_path + '.tmp'
+            if segments is not None:
+                create_word_document(None, temp_path, segments=segments)
+            else:
+                create_word_document(None, temp_path, story_trees=read_story_trees(idml_path))
+            os.replace(temp_path, word_path)
+            
+            cache = get_result_cache() if cache_key else None
+            if cache is not None:
+                cache.add_word_document(cache_key, word_path)
+    return word_path
@@ -1,88 +1,181 @@
 """
 Word Document Generator for Arabic Translation
 Creates a .docx file with translated Arabic text in RTL format
+
+document.xml is streamed into the package with lxml's incremental writer,
+so memory stays flat however many paragraphs the document has.
 """
 
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
 from lxml import etree
+from copy import deepcopy
 import os
+import zipfile
+
+DOCUMENT_TITLE = 'Translated Document - Arabic'
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = f'{{{W_NS}}}'
+
+CONTENT_TYPES_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>'''
+
+PACKAGE_RELS_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>'''
+
+DOCUMENT_RELS_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# Normal and Title styles matching python-docx's default template
+STYLES_XML = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="{W_NS}">
+<w:docDefaults>
+<w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:eastAsia="Calibri" w:hAnsi="Calibri" w:cs="Arial"/><w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="en-US" w:eastAsia="en-US" w:bidi="ar-SA"/></w:rPr></w:rPrDefault>
+<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>
+</w:docDefaults>
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>
+<w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="10"/><w:qFormat/><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="8" w:space="4" w:color="4F81BD"/></w:pBdr><w:spacing w:after="300" w:line="240" w:lineRule="auto"/><w:contextualSpacing/></w:pPr><w:rPr><w:rFonts w:ascii="Cambria" w:eastAsia="Cambria" w:hAnsi="Cambria" w:cs="Arial"/><w:color w:val="17365D"/><w:spacing w:val="5"/><w:kern w:val="28"/><w:sz w:val="52"/><w:szCs w:val="52"/></w:rPr></w:style>
+</w:styles>'''
+
+
+# Right-aligned bidi paragraph with an Arial 12pt right-to-left run. A copy
+# is reused for every paragraph of a document; only the w:t text changes
+PARAGRAPH_TEMPLATE = etree.fromstring(
+    f'<w:p xmlns:w="{W_NS}"><w:pPr><w:bidi w:val="1"/><w:jc w:val="right"/></w:pPr>'
+    '<w:r><w:rPr><w:rFonts w:ascii="Arial" w:hAnsi="Arial"/><w:sz w:val="24"/><w:rtl/></w:rPr>'
+    '<w:t/></w:r></w:p>'
+)
+TITLE_TEMPLATE = etree.fromstring(
+    f'<w:p xmlns:w="{W_NS}"><w:pPr><w:pStyle w:val="Title"/><w:jc w:val="right"/></w:pPr>'
+    '<w:r><w:t/></w:r></w:p>'
+)
+SECTION_PROPERTIES = etree.fromstring(
+    f'<w:sectPr xmlns:w="{W_NS}"><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" w:header="720" w:footer="720" w:gutter="0"/>'
+    '<w:cols w:space="720"/></w:sectPr>'
+)
 
 
-def create_word_document(idml_temp_dir, output_path):
+def create_word_document(idml_temp_dir, output_path, story_trees=None, segments=None):
     """
     Create a Word document from translated IDML content
     
     Args:
         idml_temp_dir: Path to extracted IDML directory
         output_path: Path where to save the Word document
-        
+        story_trees: Optional dict of story file name -> parsed lxml tree;
+            when given, the stories are not re-read from idml_temp_dir
+        segments: Optional translation pairs or segment manifest entries
+            ('story_file', 'translated'); when given, no XML is parsed at all
+    
     Returns:
         Path to created Word document
     """
-    # Create new Word document
-    doc = Document()
+    if segments is not None:
+        paragraphs = _segment_paragraphs(segments)
+    else:
+        if story_trees is None:
+            story_trees = _load_story_trees(idml_temp_dir)
+        paragraphs = _story_paragraphs(story_trees)
     
-    # Add title
-    title = doc.add_heading('Translated Document - Arabic', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    write_docx(output_path, paragraphs)
+    return output_path
+
+
+def write_docx(output_path, paragraphs, title=DOCUMENT_TITLE):
+    """
+    Stream a right-to-left Word document to output_path
     
-    # Extract and add translated text from Stories
+    Args:
+        output_path: Path of the .docx file to write
+        paragraphs: Iterable of paragraph texts, consumed once
+        title: Text of the right-aligned Title paragraph
+    """
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        package.writestr('_rels/.rels', PACKAGE_RELS_XML)
+        package.writestr('word/_rels/document.xml.rels', DOCUMENT_RELS_XML)
+        package.writestr('word/styles.xml', STYLES_XML)
+        
+        with package.open('word/document.xml', 'w') as stream:
+            with etree.xmlfile(stream, encoding='UTF-8') as xf:
+                xf.write_declaration(standalone=True)
+                with xf.element(W + 'document', nsmap={'w': W_NS}):
+                    with xf.element(W + 'body'):
+                        xf.write(_paragraph(TITLE_TEMPLATE, title))
+                        
+                        paragraph = _paragraph(PARAGRAPH_TEMPLATE)
+                        text_element = paragraph.find(f'.//{W}t')
+                        for text in paragraphs:
+                            text_element.text = text
+                            xf.write(paragraph)
+                        
+                        xf.write(SECTION_PROPERTIES)
+
+
+def _paragraph(template, text=None):
+    """Private copy of a paragraph template (templates are shared between threads)"""
+    paragraph = deepcopy(template)
+    if text is not None:
+        paragraph.find(f'.//{W}t').text = text
+    return paragraph
+
+
+def _segment_paragraphs(segments):
+    """Yield translated segment texts, in story file order then document order"""
+    # sorted() is stable, so segments keep their document order within a story
+    for segment in sorted(segments, key=lambda segment: segment.get('story_file', '')):
+        text = (segment.get('translated') or '').strip()
+        
+        # Skip very short content (likely formatting artifacts)
+        if len(text) < 2:
+            continue
+        
+        yield text
+
+
+def _story_paragraphs(story_trees):
+    """Yield the translated text of every story, in story file order"""
+    for story_file in sorted(story_trees):
+        try:
+            root = story_trees[story_file].getroot()
+            
+            # Find all Content elements (without namespace)
+            # IDML uses default namespace, so we need to handle it properly
+            for content in root.iter(etree.Element):
+                if content.tag.endswith('Content') and content.text and content.text.strip():
+                    text = content.text.strip()
+                    
+                    # Skip very short content (likely formatting artifacts)
+                    if len(text) < 2:
+                        continue
+                    
+                    yield text
+        
+        except Exception as e:
+            print(f"Error processing story {story_file}: {e}")
+            continue
+
+
+def _load_story_trees(idml_temp_dir):
+    """Parse every story XML file in an extracted IDML directory"""
+    story_trees = {}
     stories_dir = os.path.join(idml_temp_dir, 'Stories')
     
     if os.path.exists(stories_dir):
-        for story_file in sorted(os.listdir(stories_dir)):
+        for story_file in os.listdir(stories_dir):
             if story_file.endswith('.xml'):
-                story_path = os.path.join(stories_dir, story_file)
-                
                 try:
-                    # Parse the story XML
-                    tree = etree.parse(story_path)
-                    root = tree.getroot()
-                    
-                    # Find all Content elements (without namespace)
-                    # IDML uses default namespace, so we need to handle it properly
-                    for content in root.iter():
-                        if content.tag.endswith('Content') and content.text and content.text.strip():
-                            # Add paragraph with Arabic text
-                            text = content.text.strip()
-                            
-                            # Skip very short content (likely formatting artifacts)
-                            if len(text) < 2:
-                                continue
-                            
-                            para = doc.add_paragraph(text)
-                            
-                            # Set paragraph to RTL
-                            para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                            set_rtl_paragraph(para)
-                            
-                            # Set font for Arabic
-                            for run in para.runs:
-                                run.font.name = 'Arial'
-                                run.font.size = Pt(12)
-                                
-                                # Set RTL property for run
-                                r = run._element
-                                rPr = r.get_or_add_rPr()
-                                rtl = OxmlElement('w:rtl')
-                                rPr.append(rtl)
-                
+                    story_trees[story_file] = etree.parse(os.path.join(stories_dir, story_file))
                 except Exception as e:
                     print(f"Error processing story {story_file}: {e}")
-                    continue
     
-    # Save the document
-    doc.save(output_path)
-    return output_path
-
-
-def set_rtl_paragraph(paragraph):
-    """Set paragraph direction to RTL"""
-    pPr = paragraph._element.get_or_add_pPr()
-    bidi = OxmlElement('w:bidi')
-    bidi.set(qn('w:val'), '1')
-    pPr.append(bidi)
+    return story_trees